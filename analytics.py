@@ -0,0 +1,138 @@
+# Агрегаты для отчётов о выдачах. Триггеры на history и books обновляют их
+# при каждой записи, поэтому отчёт не сканирует историю целиком.
+# Агрегаты считаются за всё время: выдачи, перенесённые в архив, из них не вычитаются.
+# Таблицы и триггеры создаёт миграция circulation_stats
+
+from contextlib import contextmanager
+from itertools import islice
+
+import loans
+
+REBUILD_CHUNK = 50000
+
+STATS_TABLES = ("stats_books", "stats_users", "stats_daily")
+
+
+@contextmanager
+def kept(conn):
+    # Удаления из history внутри блока остаются в агрегатах: выдача не отменена,
+    # а перенесена в архив. Вызывается внутри транзакции записи
+    conn.execute("INSERT INTO stats_keep (active) VALUES (1)")
+    yield conn
+    conn.execute("DELETE FROM stats_keep")
+
+
+def add_loans(conn, source, condition, params=()):
+    # Добавляет к агрегатам выдачи из source, отобранные condition
+    chunk = f"FROM {source} WHERE {condition}"
+    conn.execute(f"""
+        INSERT INTO stats_books (book_id, title, loans, open_loans)
+        SELECT book_id, COALESCE((SELECT title FROM books WHERE id = book_id), MAX(book_title)),
+               COUNT(*), SUM(date_returned IS NULL) {chunk} AND book_id IS NOT NULL
+        GROUP BY book_id
+        ON CONFLICT(book_id) DO UPDATE SET loans = loans + excluded.loans, open_loans = open_loans + excluded.open_loans
+    """, params)
+    conn.execute(f"""
+        INSERT INTO stats_users (username, loans, open_loans)
+        SELECT username, COUNT(*), SUM(date_returned IS NULL) {chunk} GROUP BY username
+        ON CONFLICT(username) DO UPDATE SET loans = loans + excluded.loans, open_loans = open_loans + excluded.open_loans
+    """, params)
+    conn.execute(f"""
+        INSERT INTO stats_daily (day, checkouts, open_loans)
+        SELECT date(date_taken), COUNT(*), SUM(date_returned IS NULL) {chunk} GROUP BY 1
+        ON CONFLICT(day) DO UPDATE SET checkouts = checkouts + excluded.checkouts, open_loans = open_loans + excluded.open_loans
+    """, params)
+    conn.execute(f"""
+        INSERT INTO stats_daily (day, returns)
+        SELECT date(date_returned), COUNT(*) {chunk} AND date_returned IS NOT NULL GROUP BY 1
+        ON CONFLICT(day) DO UPDATE SET returns = returns + excluded.returns
+    """, params)
+
+
+def rebuild(transaction, chunk_size=REBUILD_CHUNK, progress=None, archived=()):
+    # Полный пересчёт. transaction() — контекст транзакции записи, например
+    # db.transaction; каждая пачка фиксируется отдельно, и выдачи идут во время
+    # пересчёта. Граница high_water и продвижение done хранятся в stats_rebuild:
+    # триггеры пропускают ещё не учтённые строки, а всё выше high_water и уже
+    # учтённое обновляют как обычно. Прерванный пересчёт нужно запустить заново,
+    # до тех пор агрегаты неполны.
+    # archived — записи архива (id, username, book_title, date_taken, date_returned, book_id):
+    # без них пересчёт потерял бы перенесённые выдачи. Архивация на время
+    # пересчёта останавливается (см. archive.archive_history)
+    with transaction() as conn:
+        for table in STATS_TABLES:
+            conn.execute(f"DELETE FROM {table}")
+        last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM history").fetchone()[0]
+        conn.execute("DELETE FROM stats_rebuild")
+        conn.execute("INSERT INTO stats_rebuild (high_water, done) VALUES (?, 0)", (last_id,))
+    rows = iter(archived)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        with transaction() as conn:
+            add_archived(conn, chunk)
+    start = 0
+    while start < last_id:
+        end = min(start + chunk_size, last_id)
+        with transaction() as conn:
+            add_loans(conn, "history", "id > ? AND id <= ?", (start, end))
+            conn.execute("UPDATE stats_rebuild SET done = ?", (end,))
+        start = end
+        if progress:
+            progress(end, last_id)
+    with transaction() as conn:
+        conn.execute("DELETE FROM stats_rebuild")
+
+
+def rebuilding(conn):
+    # Идёт ли пересчёт: перенос в архив в это время ждёт его окончания
+    return conn.execute("SELECT 1 FROM stats_rebuild").fetchone() is not None
+
+
+def add_archived(conn, rows):
+    conn.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS archived_loans (
+        id INTEGER PRIMARY KEY, username TEXT, book_title TEXT, date_taken TEXT, date_returned TEXT, book_id INTEGER
+        )
+    """)
+    conn.execute("DELETE FROM temp.archived_loans")
+    conn.executemany("INSERT OR IGNORE INTO temp.archived_loans VALUES (?, ?, ?, ?, ?, ?)", rows)
+    # Как ON DELETE SET NULL в history: удалённых книг в агрегатах нет
+    conn.execute("UPDATE temp.archived_loans SET book_id = NULL WHERE book_id NOT IN (SELECT id FROM main.books)")
+    # Запись, попавшая в архив, но не удалённая из history, учтётся вместе с history
+    add_loans(conn, "temp.archived_loans",
+              "NOT EXISTS (SELECT 1 FROM main.history WHERE main.history.id = archived_loans.id)")
+    conn.execute("DELETE FROM temp.archived_loans")
+
+
+# Отчёты. Каждый читает только агрегаты: размер истории на время не влияет
+
+def top_books(conn, limit=10):
+    return conn.execute("SELECT book_id, title, loans, open_loans FROM stats_books ORDER BY loans DESC LIMIT ?",
+                        (limit,)).fetchall()
+
+
+def top_borrowers(conn, limit=10):
+    return conn.execute("""
+        SELECT username, open_loans, loans FROM stats_users WHERE open_loans > 0 ORDER BY open_loans DESC LIMIT ?
+    """, (limit,)).fetchall()
+
+
+def open_count(conn):
+    return conn.execute("SELECT COALESCE(SUM(open_loans), 0) FROM stats_daily").fetchone()[0]
+
+
+def daily_volume(conn, days=30):
+    return conn.execute("SELECT day, checkouts, returns FROM stats_daily WHERE day >= date('now', ?) ORDER BY day",
+                        (f"-{days} days",)).fetchall()
+
+
+def report(conn, limit=10, days=30):
+    return {
+        "top_books": top_books(conn, limit),
+        "top_borrowers": top_borrowers(conn, limit),
+        "open": open_count(conn),
+        "overdue": loans.overdue_count(conn),  # по сроку возврата, индекс idx_history_due
+        "daily": daily_volume(conn, days),
+    }
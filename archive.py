@@ -0,0 +1,149 @@
+import heapq
+import json
+import os
+import zlib
+
+import analytics
+import db
+
+# Архив закрытых выдач. Старые возвращённые записи переносятся из history
+# в отдельную базу пачками, так что горячая таблица остаётся маленькой.
+# Агрегаты отчётов при переносе не меняются: они считаются за всё время.
+# Архив читается только по явному запросу и хранит записи пачками в JSON,
+# по желанию сжатом zlib
+
+ARCHIVE_ENV = "LIBRARY_ARCHIVE"
+ARCHIVE_AGE_DAYS = 365  # переносятся выдачи, возвращённые раньше этого срока
+ARCHIVE_CHUNK = 2000  # записей в одной транзакции и в одной пачке архива
+SEARCH_LIMIT = 5000
+
+COLUMNS = "id, username, book_title, date_taken, date_returned, book_id, user_id, due_date"
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS archive_chunks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    first_taken TEXT NOT NULL,
+    last_taken TEXT NOT NULL,
+    rows INTEGER NOT NULL,
+    compressed INTEGER NOT NULL,
+    payload BLOB NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS archive_ids (id INTEGER PRIMARY KEY);
+"""
+
+
+def archive_path(path=None):
+    # По умолчанию рядом с основной базой: library.db -> library.archive.db
+    return os.environ.get(ARCHIVE_ENV) or os.path.splitext(path or db.pool.path)[0] + ".archive.db"
+
+
+def connect(path=None):
+    conn = db.connect(path or archive_path())
+    conn.executescript(SCHEMA)
+    # Архивы, созданные до появления archive_ids, получают список id один раз
+    if not conn.execute("SELECT 1 FROM archive_ids LIMIT 1").fetchone():
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany("INSERT OR IGNORE INTO archive_ids (id) VALUES (?)",
+                             [(row[0],) for row in stored(conn)])
+    return conn
+
+
+def encode(rows, compress):
+    data = json.dumps(rows, ensure_ascii=False).encode()
+    return zlib.compress(data) if compress else data
+
+
+def decode(payload, compressed):
+    return json.loads(zlib.decompress(payload) if compressed else payload)
+
+
+def archive_history(age_days=ARCHIVE_AGE_DAYS, chunk_size=ARCHIVE_CHUNK, compress=True, path=None,
+                    progress=None, cancelled=None):
+    # Возвращает число перенесённых записей. Пачка выбирается и удаляется из history
+    # в одной транзакции записи, а внутри неё фиксируется в архиве: при сбое между
+    # двумя коммитами записи останутся в history, и следующий запуск допишет в архив
+    # только те, чьих id в нём ещё нет. Отмена срабатывает между пачками
+    cutoff = f"-{age_days} days"
+    count = 0
+    archive = connect(path)
+    try:
+        while not (cancelled and cancelled()):
+            with db.transaction() as conn:
+                if analytics.rebuilding(conn):
+                    # Пересчёт мог уже пройти архив: перенесённые сейчас выдачи в нём бы потерялись
+                    break
+                rows = conn.execute(f"""
+                    SELECT {COLUMNS} FROM history
+                    WHERE date_returned IS NOT NULL AND date_returned < datetime('now', ?)
+                    ORDER BY date_taken, id LIMIT ?
+                """, (cutoff, chunk_size)).fetchall()
+                if not rows:
+                    break
+                with archive:
+                    archive.execute("BEGIN IMMEDIATE")
+                    new = [row for row in rows
+                           if archive.execute("INSERT OR IGNORE INTO archive_ids (id) VALUES (?)",
+                                              (row[0],)).rowcount]
+                    if new:
+                        archive.execute("""
+                            INSERT INTO archive_chunks (first_taken, last_taken, rows, compressed, payload)
+                            VALUES (?, ?, ?, ?, ?)
+                        """, (new[0][3], new[-1][3], len(new), int(compress), encode(new, compress)))
+                with analytics.kept(conn):
+                    conn.executemany("DELETE FROM history WHERE id = ?", [(row[0],) for row in rows])
+            count += len(rows)
+            if progress:
+                progress(count)
+    finally:
+        archive.close()
+    return count
+
+
+def search(text="", limit=SEARCH_LIMIT, path=None):
+    # Полный просмотр архива: записи в формате HistoryTableModel, новые первыми
+    path = path or archive_path()
+    if not os.path.exists(path):
+        return []
+    archive = connect(path)
+    try:
+        # Срок хранится с миграции 6; архивные выдачи закрыты и не просрочены
+        records = (tuple(row[:5]) + (row[7] if len(row) > 7 else None, 0)
+                   for row in stored(archive) if db.matches(text, row[1], row[2]))
+        return heapq.nlargest(limit, records, key=lambda record: (record[3], record[0]))
+    finally:
+        archive.close()
+
+
+def stored(archive):
+    # Все записи архива по одному разу: архивы до archive_ids могли хранить пачку повторно
+    seen = set()
+    for compressed, payload in archive.execute("SELECT compressed, payload FROM archive_chunks"):
+        for row in decode(payload, compressed):
+            if row[0] not in seen:
+                seen.add(row[0])
+                yield row
+
+
+def archived_loans(path=None):
+    # (id, username, book_title, date_taken, date_returned, book_id) для пересчёта агрегатов
+    path = path or archive_path()
+    if not os.path.exists(path):
+        return
+    archive = connect(path)
+    try:
+        for row in stored(archive):
+            yield row[:6]
+    finally:
+        archive.close()
+
+
+def archived_count(path=None):
+    path = path or archive_path()
+    if not os.path.exists(path):
+        return 0
+    archive = connect(path)
+    try:
+        return archive.execute("SELECT COUNT(*) FROM archive_ids").fetchone()[0]
+    finally:
+        archive.close()
@@ -0,0 +1,212 @@
+import hashlib
+import hmac
+import secrets
+import threading
+import time
+from collections import OrderedDict, deque, namedtuple
+
+# Хеширование паролей. Параметры хранятся в самой строке хеша,
+# поэтому стоимость можно менять, не ломая уже сохранённые пароли
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+PBKDF2_ITERATIONS = 300000  # если в сборке Python нет hashlib.scrypt
+SALT_BYTES = 16
+
+SESSION_TTL = 8 * 60 * 60  # секунды
+SESSION_MAX = 1000
+
+FAILED_LOGIN_LIMIT = 5  # неудачных попыток
+FAILED_LOGIN_WINDOW = 60  # за столько секунд
+LOCKOUT = 30  # после чего вход блокируется на столько секунд
+# Перебор одного пароля по многим именам: ошибки с одного источника (клиента) вместе
+FAILED_LOGIN_SOURCE_LIMIT = 50
+
+Session = namedtuple("Session", "token username role expires")
+
+
+def configure_cost(n=None, r=None, p=None, iterations=None):
+    global SCRYPT_N, SCRYPT_R, SCRYPT_P, PBKDF2_ITERATIONS
+    SCRYPT_N = n or SCRYPT_N
+    SCRYPT_R = r or SCRYPT_R
+    SCRYPT_P = p or SCRYPT_P
+    PBKDF2_ITERATIONS = iterations or PBKDF2_ITERATIONS
+
+
+def _scrypt(password, salt, n, r, p):
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * r * n, dklen=32)
+
+
+def _pbkdf2(password, salt, iterations):
+    return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations)
+
+
+def hash_password(password):
+    salt = secrets.token_bytes(SALT_BYTES)
+    if hasattr(hashlib, "scrypt"):
+        digest = _scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+        return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${salt.hex()}${digest.hex()}"
+    digest = _pbkdf2(password, salt, PBKDF2_ITERATIONS)
+    return f"pbkdf2_sha256${PBKDF2_ITERATIONS}${salt.hex()}${digest.hex()}"
+
+
+def current_params(stored):
+    if hasattr(hashlib, "scrypt"):
+        return stored.startswith(f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}$")
+    return stored.startswith(f"pbkdf2_sha256${PBKDF2_ITERATIONS}$")
+
+
+def verify_password(password, stored):
+    # Возвращает (совпал ли пароль, нужно ли пересчитать хеш)
+    parts = stored.split("$")
+    if parts[0] == "scrypt" and len(parts) == 6:
+        n, r, p = (int(value) for value in parts[1:4])
+        digest = _scrypt(password, bytes.fromhex(parts[4]), n, r, p)
+        ok = hmac.compare_digest(digest, bytes.fromhex(parts[5]))
+    elif parts[0] == "pbkdf2_sha256" and len(parts) == 4:
+        digest = _pbkdf2(password, bytes.fromhex(parts[2]), int(parts[1]))
+        ok = hmac.compare_digest(digest, bytes.fromhex(parts[3]))
+    else:
+        # Старые записи хранили пароль открытым текстом
+        return hmac.compare_digest(password.encode(), stored.encode()), True
+    return ok, ok and not current_params(stored)
+
+
+_dummy = None
+
+
+def dummy_hash():
+    # Хеш случайного пароля с текущими параметрами. Для несуществующего имени
+    # пароль сверяется с ним: ответ занимает столько же, сколько и для
+    # существующего, и по времени нельзя узнать, есть ли такой пользователь
+    global _dummy
+    if _dummy is None or not current_params(_dummy):
+        _dummy = hash_password(secrets.token_hex(16))
+    return _dummy
+
+
+def _evict(entries, now, max_size):
+    # Записи упорядочены по сроку действия: устаревшие всегда в начале
+    while entries and (next(iter(entries.values())).expires <= now or len(entries) > max_size):
+        entries.popitem(last=False)
+
+
+# Подтверждённые входы и сессии в памяти процесса. Повторный вход с тем же
+# паролем сверяется с быстрым HMAC вместо повторного scrypt. В HMAC входит и
+# сохранённый хеш, поэтому смена пароля в базе сразу делает запись недействительной
+class SessionCache:
+    Verified = namedtuple("Verified", "digest expires")
+
+    def __init__(self, ttl=SESSION_TTL, max_size=SESSION_MAX):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.sessions = OrderedDict()
+        self.verified = OrderedDict()
+        self.key = secrets.token_bytes(32)
+        self.lock = threading.Lock()
+
+    def _digest(self, username, password, stored):
+        return hmac.new(self.key, f"{username}\0{password}\0{stored}".encode(), hashlib.sha256).digest()
+
+    def remember(self, username, password, stored):
+        now = time.monotonic()
+        with self.lock:
+            self.verified.pop(username, None)
+            self.verified[username] = self.Verified(self._digest(username, password, stored), now + self.ttl)
+            _evict(self.verified, now, self.max_size)
+
+    def lookup(self, username, password, stored):
+        # True, если этот пароль уже сверяли с этим же хешем
+        now = time.monotonic()
+        with self.lock:
+            _evict(self.verified, now, self.max_size)
+            entry = self.verified.get(username)
+        return bool(entry) and hmac.compare_digest(entry.digest, self._digest(username, password, stored))
+
+    def forget(self, username):
+        with self.lock:
+            self.verified.pop(username, None)
+            for token in [token for token, session in self.sessions.items() if session.username == username]:
+                del self.sessions[token]
+
+    def issue(self, username, role):
+        now = time.monotonic()
+        session = Session(secrets.token_urlsafe(32), username, role, now + self.ttl)
+        with self.lock:
+            self.sessions[session.token] = session
+            _evict(self.sessions, now, self.max_size)
+        return session
+
+    def get(self, token):
+        with self.lock:
+            _evict(self.sessions, time.monotonic(), self.max_size)
+            return self.sessions.get(token)
+
+    def revoke(self, token):
+        with self.lock:
+            self.sessions.pop(token, None)
+
+
+class LoginThrottled(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Слишком много неудачных попыток, повторите через {retry_after:.0f} с")
+        self.retry_after = retry_after
+
+
+# Ограничение частоты неудачных входов по имени пользователя и, если вызывающий
+# его знает, по источнику (адрес клиента, терминал): иначе один пароль можно
+# перебирать по списку имён. Источник блокирует только сам себя
+class LoginRateLimiter:
+    def __init__(self, limit=FAILED_LOGIN_LIMIT, window=FAILED_LOGIN_WINDOW, lockout=LOCKOUT, max_users=SESSION_MAX,
+                 source_limit=FAILED_LOGIN_SOURCE_LIMIT):
+        self.limit = limit
+        self.source_limit = source_limit
+        self.window = window
+        self.lockout = lockout
+        self.max_users = max_users
+        self.failures = OrderedDict()
+        self.locked = {}
+        self.lock = threading.Lock()
+
+    def keys(self, username, source):
+        yield username, self.limit
+        if source is not None:
+            yield ("source", source), self.source_limit
+
+    def check(self, username, source=None):
+        with self.lock:
+            now = time.monotonic()
+            for key, _ in self.keys(username, source):
+                until = self.locked.get(key)
+                if until is None:
+                    continue
+                if until > now:
+                    raise LoginThrottled(until - now)
+                del self.locked[key]
+
+    def failure(self, username, source=None):
+        now = time.monotonic()
+        with self.lock:
+            for key, limit in self.keys(username, source):
+                self._record(key, limit, now)
+            while len(self.failures) > self.max_users:
+                self.failures.popitem(last=False)
+
+    def _record(self, key, limit, now):
+        attempts = self.failures.pop(key, None) or deque()
+        attempts.append(now)
+        while attempts and attempts[0] <= now - self.window:
+            attempts.popleft()
+        if len(attempts) >= limit:
+            self.locked[key] = now + self.lockout
+            attempts.clear()
+        self.failures[key] = attempts
+
+    def success(self, username):
+        with self.lock:
+            self.failures.pop(username, None)
+            self.locked.pop(username, None)
+
+
+sessions = SessionCache()
+limiter = LoginRateLimiter()
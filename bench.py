@@ -0,0 +1,261 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+import db
+import transfer
+from service import LibraryService, history_cache
+
+# Нагрузочные замеры на синтетической библиотеке:
+#   python bench.py --books 100000 --history 1000000 --output bench.json
+#   python bench.py --books 100000 --compare bench.json
+
+FIRST_NAMES = ["Лев", "Фёдор", "Антон", "Михаил", "Иван", "Александр", "Николай", "Анна",
+               "Марина", "Борис", "Владимир", "Сергей", "Евгений", "Максим", "Ольга", "Татьяна"]
+LAST_NAMES = ["Толстой", "Достоевский", "Чехов", "Булгаков", "Тургенев", "Пушкин", "Гоголь",
+              "Ахматова", "Цветаева", "Пастернак", "Набоков", "Шолохов", "Горький", "Лермонтов",
+              "Бунин", "Куприн", "Гончаров", "Лесков", "Платонов", "Замятин"]
+TITLE_WORDS = ["война", "мир", "преступление", "наказание", "мастер", "маргарита", "отцы", "дети",
+               "вишнёвый", "сад", "тихий", "дон", "белая", "гвардия", "мёртвые", "души", "герой",
+               "нашего", "времени", "капитанская", "дочка", "идиот", "бесы", "братья", "собачье",
+               "сердце", "палата", "чайка", "дым", "новь", "воскресение", "детство", "юность",
+               "степь", "остров", "море", "город", "ночь", "осень", "весна", "обломов", "котлован"]
+SEARCH_QUERIES = ["тол", "война", "мастер марг", "дост", "чехов сад", "Ночь", "пуш остр"]
+
+HISTORY_START = datetime(2020, 1, 1)
+PAGE_SIZE = 100
+
+
+def fake_title(rng):
+    words = rng.sample(TITLE_WORDS, rng.randint(1, 4))
+    return " ".join(words).capitalize()
+
+
+def fake_author(rng):
+    return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+
+def generate(books, history, users, seed=0, progress=None):
+    rng = random.Random(seed)
+    service = LibraryService()
+    service.init_db()
+
+    def report(table):
+        return (lambda count: progress(table, count)) if progress else None
+
+    transfer.import_rows("users", ((f"user{i}", f"pass{i}", "guest") for i in range(users)),
+                         progress=report("users"))
+    transfer.import_rows("books", ((fake_title(rng), fake_author(rng), "Доступна") for _ in range(books)),
+                         progress=report("books"))
+
+    first_id, last_id = db.query_one("SELECT MIN(id), MAX(id) FROM books")
+    step = timedelta(days=5 * 365) / max(history, 1)
+
+    def loans():
+        for i in range(history):
+            taken = HISTORY_START + step * i
+            returned = None if rng.random() < 0.1 else taken + timedelta(days=rng.randint(1, 60))
+            yield (f"user{rng.randrange(max(users, 1))}", rng.randint(first_id, last_id),
+                   taken.strftime("%Y-%m-%d %H:%M:%S"),
+                   returned.strftime("%Y-%m-%d %H:%M:%S") if returned else None)
+
+    query = """
+        INSERT INTO history (username, book_title, book_id, date_taken, date_returned)
+        SELECT ?, title, id, ?, ? FROM books WHERE id = ?
+    """
+    count = 0
+    for chunk in transfer.chunks(loans(), transfer.CHUNK_SIZE):
+        with db.transaction() as conn:
+            conn.executemany(query, [(user, taken, returned, book_id) for user, book_id, taken, returned in chunk])
+        count += len(chunk)
+        if progress:
+            progress("history", count)
+
+
+def measure(operation, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        operation()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def summary(timings, ops=1):
+    timings = sorted(timings)
+    return {
+        "runs": len(timings),
+        "min_ms": timings[0] * 1000,
+        "median_ms": statistics.median(timings) * 1000,
+        "p95_ms": timings[int(0.95 * (len(timings) - 1))] * 1000,
+        "ops_per_sec": ops * len(timings) / sum(timings) if sum(timings) else None,
+    }
+
+
+def bench_search(service, repeat):
+    results = {}
+    for text in SEARCH_QUERIES:
+        results[text] = summary(measure(lambda: service.search_books(text), repeat))
+    results["<весь каталог>"] = summary(measure(lambda: service.search_books(""), max(1, repeat // 5)))
+    return results
+
+
+def bench_history(service, pages):
+    # Кэш страниц очищается перед каждым замером, иначе измеряется словарь, а не запрос
+    results = {}
+    for status_filter in ("Все", "Не возвращена", "Возвращена"):
+        timings = []
+        after = None
+        for _ in range(pages):
+            history_cache.clear()
+            start = time.perf_counter()
+            records = service.history_page("", status_filter, after, PAGE_SIZE)
+            timings.append(time.perf_counter() - start)
+            if len(records) < PAGE_SIZE:
+                break
+            after = (records[-1][3], records[-1][0])
+        results[status_filter] = summary(timings)
+    search = lambda: service.history_page("user1", "Все", None, PAGE_SIZE)
+    results["поиск user1"] = summary(measure(lambda: (history_cache.clear(), search()), pages))
+    results["поиск user1 из кэша"] = summary(measure(search, pages))
+    return results
+
+
+def bench_checkout(service, count):
+    book_ids = [row[0] for row in db.query("SELECT id FROM books WHERE status = 'Доступна' LIMIT ?", (count,))]
+    borrow = measure_each(lambda book_id: service.borrow_book("bench", book_id), book_ids)
+    giveback = measure_each(service.return_book, book_ids)
+    toggle = measure_each(lambda book_id: service.toggle_status("bench", book_id, "Доступна"), book_ids)
+    service.return_books(book_ids)
+    batch = measure(lambda: (service.borrow_books("bench", book_ids), service.return_books(book_ids)), 5)
+    return {"borrow": summary(borrow), "return": summary(giveback), "toggle": summary(toggle),
+            "batch_borrow_return": summary(batch, ops=2 * len(book_ids))}
+
+
+def measure_each(operation, items):
+    timings = []
+    for item in items:
+        start = time.perf_counter()
+        operation(item)
+        timings.append(time.perf_counter() - start)
+    return timings or [0.0]
+
+
+def bench_qt(service, repeat):
+    # Заполнение таблицы без дисплея
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5.QtWidgets import QApplication, QTableView
+    from models import BookTableModel
+
+    app = QApplication.instance() or QApplication([])
+    model = BookTableModel()
+    view = QTableView()
+    view.setModel(model)
+    view.resize(700, 500)
+    view.show()
+    books = service.search_books("")
+
+    def populate():
+        model.setBooks(books)
+        app.processEvents()
+
+    def sort():
+        model.sort(0)
+        app.processEvents()
+
+    return {"populate": summary(measure(populate, repeat)), "sort": summary(measure(sort, repeat))}
+
+
+def run(args):
+    service = LibraryService()
+    service.init_db()
+    results = {
+        "search": bench_search(service, args.repeat),
+        "history": bench_history(service, args.pages),
+        "checkout": bench_checkout(service, args.checkouts),
+    }
+    if args.qt:
+        results["qt"] = bench_qt(service, args.repeat)
+    return results
+
+
+def flatten(results, prefix=""):
+    for name, value in results.items():
+        if "median_ms" in value:
+            yield prefix + name, value["median_ms"]
+        else:
+            yield from flatten(value, f"{prefix}{name}/")
+
+
+def compare(report, baseline, tolerance):
+    # Регрессия — медиана выросла больше чем на tolerance
+    old = dict(flatten(baseline["results"]))
+    regressions = []
+    for name, median in flatten(report["results"]):
+        if name in old and old[name] > 0 and median > old[name] * (1 + tolerance):
+            regressions.append(f"{name}: {old[name]:.2f} мс -> {median:.2f} мс")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры производительности библиотеки")
+    parser.add_argument("--db", default="bench.db", help="файл синтетической базы")
+    parser.add_argument("--books", type=int, default=10000)
+    parser.add_argument("--history", type=int, default=50000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--reuse", action="store_true", help="не пересоздавать базу, если она есть")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--checkouts", type=int, default=200)
+    parser.add_argument("--qt", action="store_true", help="замерить заполнение таблицы (offscreen)")
+    parser.add_argument("--output", help="куда записать JSON с результатами")
+    parser.add_argument("--compare", help="JSON предыдущего прогона для поиска регрессий")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    if not (args.reuse and os.path.exists(args.db)):
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(args.db + suffix):
+                os.remove(args.db + suffix)
+        db.configure(args.db)
+        start = time.perf_counter()
+        generate(args.books, args.history, args.users, args.seed,
+                 progress=lambda table, count: print(f"\rгенерация {table}: {count}", end="", file=sys.stderr))
+        print(f"\rгенерация: {time.perf_counter() - start:.1f} с", file=sys.stderr)
+    db.configure(args.db)
+
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "sizes": {"books": db.row_count("books"), "history": db.row_count("history"), "users": args.users},
+        "results": run(args),
+        "db_stats": dict(db.stats),
+    }
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(text)
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            regressions = compare(report, json.load(file), args.tolerance)
+        for line in regressions:
+            print("РЕГРЕССИЯ", line, file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
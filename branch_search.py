@@ -0,0 +1,130 @@
+from PyQt5.QtCore import QThread, QTimer, pyqtSignal
+from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QLineEdit, QTableWidget, QTableWidgetItem, QHeaderView,
+                             QLabel, QPushButton, QMessageBox)
+
+from search import DEBOUNCE_MS
+from store import STATUS_AVAILABLE, STATUS_BORROWED
+
+EMIT_BATCH = 200  # строк за один сигнал в GUI-поток
+
+
+class BranchSearchWorker(QThread):
+    rowsFound = pyqtSignal(int, list)
+
+    def __init__(self, dialog, generation, text):
+        super().__init__()
+        self.dialog = dialog
+        self.generation = generation
+        self.text = text
+
+    def stale(self):
+        return self.dialog.generation != self.generation
+
+    def run(self):
+        results = self.dialog.catalog.search(self.text)
+        batch = []
+        try:
+            for book in results:
+                if self.stale():
+                    return
+                batch.append(book)
+                if len(batch) >= EMIT_BATCH:
+                    self.rowsFound.emit(self.generation, batch)
+                    batch = []
+            self.rowsFound.emit(self.generation, batch)
+        finally:
+            results.close()  # останавливает потоки филиалов
+
+
+# Поиск по всем филиалам: строки появляются по мере слияния результатов
+class BranchSearchDialog(QDialog):
+    COLUMNS = ["Филиал", "ID", "Название", "Автор", "Статус"]
+
+    def __init__(self, catalog, username, parent=None):
+        super().__init__(parent)
+        self.catalog = catalog
+        self.username = username
+        self.generation = 0
+        self.workers = []
+        self.setWindowTitle("Поиск по филиалам")
+        self.setGeometry(300, 200, 800, 500)
+
+        layout = QVBoxLayout()
+
+        self.totalsLabel = QLabel()
+        layout.addWidget(self.totalsLabel)
+
+        self.searchInput = QLineEdit()
+        self.searchInput.setPlaceholderText("Поиск по названию или автору во всех филиалах")
+        layout.addWidget(self.searchInput)
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(DEBOUNCE_MS)
+        self.timer.timeout.connect(self.search)
+        self.searchInput.textChanged.connect(self.timer.start)
+
+        self.table = QTableWidget()
+        self.table.setColumnCount(len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.table.setSelectionBehavior(QTableWidget.SelectRows)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        layout.addWidget(self.table)
+
+        self.borrowButton = QPushButton("Взять/Вернуть книгу")
+        self.borrowButton.clicked.connect(self.toggleStatus)
+        layout.addWidget(self.borrowButton)
+
+        self.setLayout(layout)
+        self.catalog.init_db()  # для уже проверенных баз это одно чтение user_version
+        self.showTotals()
+        self.search()
+
+    def showTotals(self):
+        self.totalsLabel.setText("; ".join(f"{name}: книг {books}, на руках {loans}"
+                                           for name, books, loans in self.catalog.totals()))
+
+    def search(self):
+        self.generation += 1
+        self.table.setRowCount(0)
+        self.workers = [worker for worker in self.workers if worker.isRunning()]
+        worker = BranchSearchWorker(self, self.generation, self.searchInput.text())
+        worker.rowsFound.connect(self.appendRows)
+        self.workers.append(worker)
+        worker.start()
+
+    def appendRows(self, generation, books):
+        if generation != self.generation:
+            return
+        first = self.table.rowCount()
+        self.table.setRowCount(first + len(books))
+        for row, book in enumerate(books, start=first):
+            for column, value in enumerate(book):
+                self.table.setItem(row, column, QTableWidgetItem(str(value)))
+
+    def toggleStatus(self):
+        row = self.table.currentRow()
+        if row < 0:
+            QMessageBox.warning(self, "Ошибка", "Выберите книгу")
+            return
+        branch, book_id, status = (self.table.item(row, column).text() for column in (0, 1, 4))
+        # Выдача записывается в базу того филиала, где числится книга
+        if status == STATUS_BORROWED:
+            status = self.catalog.give_back(branch, int(book_id))
+            new_status, changed = status or STATUS_AVAILABLE, status is not None
+        else:
+            new_status, changed = STATUS_BORROWED, self.catalog.borrow(branch, self.username, int(book_id))
+        if not changed:
+            QMessageBox.warning(self, "Ошибка", "Статус книги уже изменён другим пользователем")
+            self.search()
+            return
+        self.table.item(row, 4).setText(new_status)
+        self.showTotals()
+
+    def done(self, result):
+        # Закрытие окна делает поиск устаревшим и дожидается его потоков
+        self.generation += 1
+        for worker in self.workers:
+            worker.wait()
+        super().done(result)
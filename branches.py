@@ -0,0 +1,163 @@
+import heapq
+import os
+import queue
+import sqlite3
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+
+import db
+from checkout import CheckoutEngine
+
+# Общий каталог нескольких филиалов. У каждого филиала своя база и свой пул;
+# поиск идёт по всем базам параллельно, а выдача — только в базе владельца:
+#   python main.py --branch Центр=center.db --branch Север=north.db
+
+BRANCHES_ENV = "LIBRARY_BRANCHES"  # "Центр=center.db;Север=north.db"
+FETCH_CHUNK = 500  # строк за одну передачу из потока филиала
+QUEUE_CHUNKS = 4  # сколько пачек поток может опередить слияние
+
+BranchBook = namedtuple("BranchBook", "branch id title author status")
+
+# Первый столбец — ключ слияния: релевантность для поиска, название для полного списка
+SEARCH_SQL = """
+    SELECT books_fts.rank, books.id, books.title, books.author, books.status
+    FROM books_fts JOIN books ON books.id = books_fts.rowid
+    WHERE books_fts MATCH ? ORDER BY books_fts.rank
+"""
+CATALOG_SQL = "SELECT title, id, title, author, status FROM books ORDER BY title"
+
+_DONE = object()
+
+
+def parse_branch(spec):
+    # "Центр=center.db" или просто "center.db" — тогда имя берётся из файла
+    name, sep, path = spec.partition("=")
+    if not sep:
+        path = spec
+        name = os.path.splitext(os.path.basename(spec))[0]
+    return name, path
+
+
+def branches_from_env():
+    specs = os.environ.get(BRANCHES_ENV, "")
+    return [parse_branch(spec) for spec in specs.split(";") if spec]
+
+
+class Branch:
+    def __init__(self, name, path):
+        self.name = name
+        self.path = path
+        self.pool = db.ConnectionPool(path)
+        self.checkout = CheckoutEngine(pool=self.pool)
+
+    def rows(self, text, chunks, stop):
+        # Выполняется в своём потоке; пачки строк уходят в очередь chunks
+        match = db.fts_query(text)
+        try:
+            with self.pool.connection() as conn:
+                cursor = conn.execute(SEARCH_SQL, (match,)) if match else conn.execute(CATALOG_SQL)
+                while not stop.is_set():
+                    rows = cursor.fetchmany(FETCH_CHUNK)
+                    if not rows:
+                        break
+                    _put(chunks, rows, stop)
+        except Exception as e:
+            _put(chunks, e, stop)
+        _put(chunks, _DONE, stop)
+
+
+def _put(chunks, item, stop):
+    # Слияние могли прервать: тогда поток не должен ждать места в очереди вечно
+    while not stop.is_set():
+        try:
+            chunks.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            pass
+
+
+def _drain(name, chunks):
+    while True:
+        item = chunks.get()
+        if item is _DONE:
+            return
+        if isinstance(item, Exception):
+            raise item
+        for row in item:
+            yield name, row
+
+
+class FederatedCatalog:
+    def __init__(self, branches):
+        self.branches = [Branch(name, path) for name, path in branches]
+        self.by_name = {branch.name: branch for branch in self.branches}
+
+    def init_db(self):
+        for branch in self.branches:
+            db.init_db(branch.pool)
+
+    def search(self, text=""):
+        # Генератор BranchBook: по потоку на филиал, результаты сливаются по мере
+        # поступления с сохранением порядка. Закрытие генератора останавливает потоки
+        stop = threading.Event()
+        streams = []
+        threads = []
+        for branch in self.branches:
+            chunks = queue.Queue(QUEUE_CHUNKS)
+            thread = threading.Thread(target=branch.rows, args=(text, chunks, stop), daemon=True)
+            thread.start()
+            threads.append(thread)
+            streams.append(_drain(branch.name, chunks))
+        try:
+            for name, row in heapq.merge(*streams, key=lambda item: item[1][0]):
+                yield BranchBook(name, *row[1:])
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+    # Выдача и возврат выполняются в базе филиала, которому принадлежит книга
+
+    def borrow(self, branch, username, book_id):
+        return self.by_name[branch].checkout.borrow(username, book_id)
+
+    def give_back(self, branch, book_id):
+        return self.by_name[branch].checkout.give_back(book_id)
+
+    @contextmanager
+    def attached(self, conn, branches):
+        # Присоединяет базы филиалов к conn как shard0, shard1... на время блока.
+        # Больше conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED) баз сразу (по умолчанию 10)
+        # SQLite не допускает, поэтому вызывающий передаёт их пачками
+        count = 0
+        try:
+            for branch in branches:
+                conn.execute(f"ATTACH DATABASE ? AS shard{count}", (branch.path,))
+                count += 1
+            yield conn
+        finally:
+            for number in range(count):
+                conn.execute(f"DETACH DATABASE shard{number}")
+
+    def totals(self):
+        # (филиал, книг, на руках): по одному запросу на пачку присоединённых баз
+        conn = db.connect(":memory:")
+        try:
+            limit = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+            result = []
+            for start in range(0, len(self.branches), limit):
+                batch = self.branches[start:start + limit]
+                query = " UNION ALL ".join(
+                    f"""SELECT ?, (SELECT count FROM shard{number}.row_counts WHERE name = 'books'),
+                                  (SELECT COALESCE(SUM(open_loans), 0) FROM shard{number}.stats_daily)"""
+                    for number in range(len(batch)))
+                with self.attached(conn, batch):
+                    result.extend(conn.execute(query, [branch.name for branch in batch]).fetchall())
+            return result
+        finally:
+            conn.close()
+
+    def close(self):
+        for branch in self.branches:
+            branch.pool.close()
@@ -0,0 +1,188 @@
+import sqlite3
+import threading
+
+from PyQt5.QtCore import QObject, QThread, pyqtSignal
+
+import changelog
+import db
+from service import LibraryService, HISTORY_COLUMNS
+from store import BookStore
+
+WATCH_MS = 250  # как часто сторож сверяет PRAGMA data_version
+FEED_LIMIT = 2000  # записей журнала за одно чтение
+
+BOOK_COLUMNS = "id, title, author, status"
+
+
+# Поток, читающий журнал изменений. Пока базу никто не менял, он выполняет только
+# PRAGMA data_version; после коммита читает записи журнала с последнего seq и
+# отправляет окнам актуальное состояние изменённых строк
+class ChangeWatcher(QThread):
+    booksChanged = pyqtSignal(list)
+    historyChanged = pyqtSignal(list)
+    resync = pyqtSignal()
+
+    def __init__(self, after=None, interval_ms=WATCH_MS, parent=None):
+        super().__init__(parent)
+        self.path = db.pool.path
+        self.after = after
+        self.interval = interval_ms / 1000
+        self.stopped = threading.Event()
+
+    def run(self):
+        # data_version меняется только после коммитов других соединений,
+        # поэтому у сторожа своё соединение вне пула
+        conn = db.connect(self.path)
+        try:
+            if self.after is None:
+                self.after = changelog.last_seq(conn)
+            version = conn.execute("PRAGMA data_version").fetchone()[0]
+            while not self.stopped.wait(self.interval):
+                current = conn.execute("PRAGMA data_version").fetchone()[0]
+                if current != version:
+                    version = current
+                    self.poll(conn)
+        finally:
+            conn.close()
+
+    def poll(self, conn):
+        # Журнал дочитывается до конца страницами по FEED_LIMIT: пакетная операция
+        # пишет по несколько записей на книгу, и за один опрос их набираются тысячи
+        while not self.stopped.is_set():
+            result = changelog.read(conn, self.after, FEED_LIMIT)
+            if result is None:
+                # Отстали сильнее, чем хранит журнал: окна перечитают данные целиком
+                self.after = changelog.last_seq(conn)
+                self.resync.emit()
+                return
+            after, changed = result
+            if after == self.after:
+                return
+            self.after = after
+            if changed["books"]:
+                self.booksChanged.emit(changelog.current_rows(conn, "books", BOOK_COLUMNS, changed["books"]))
+            if changed["history"]:
+                self.historyChanged.emit(changelog.current_rows(conn, "history", HISTORY_COLUMNS, changed["history"]))
+
+    def stop(self):
+        self.stopped.set()
+        self.wait()
+
+
+# Кэш каталога в памяти: книги по id. Изменения из приложения применяются
+# точечно сразу, а чужие приходят из журнала изменений через ChangeWatcher
+class CatalogCache(QObject):
+    # Изменения передаются списками: пакетная операция обновляет таблицу за раз
+    booksAdded = pyqtSignal(list)  # (id, название, автор, статус)
+    booksRemoved = pyqtSignal(list)  # id
+    booksChanged = pyqtSignal(list)  # (id, статус)
+    externalChange = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.books = {}
+        self.loaded = False
+        self.watcher = None
+
+    def watch(self, after=None):
+        # after — seq журнала, прочитанный до загрузки каталога
+        self.watcher = ChangeWatcher(after, parent=self)
+        self.watcher.booksChanged.connect(self.applyChanges)
+        self.watcher.resync.connect(self.resync)
+        self.watcher.start()
+
+    def resync(self):
+        self.loaded = False
+        self.externalChange.emit()
+
+    def replace(self, store):
+        # Полный список книг, только что прочитанный из базы
+        self.books = {store.ids[row]: store.book(row)[1:] for row in range(len(store))}
+        self.loaded = True
+
+    def store(self):
+        return BookStore((book_id,) + book for book_id, book in self.books.items())
+
+    def applyChanges(self, changes):
+        # Сравнение с кэшем делает повтор безопасным: свои записи уже применены
+        # через apply* и из журнала ничего не меняют
+        if not self.loaded:
+            self.externalChange.emit()
+            return
+        removed, added, changed = [], [], []
+        for book_id, row in changes:
+            current = self.books.get(book_id)
+            book = row[1:] if row else None
+            if book == current:
+                continue
+            if book is None:
+                removed.append(book_id)
+            elif current is None or current[:2] != book[:2]:
+                if current is not None:
+                    removed.append(book_id)
+                added.append(row)
+            else:
+                changed.append((book_id, book[2]))
+        self.applyDeletes(removed)
+        self.applyInserts(added)
+        self.applyStatuses(changed)
+
+    def applyInserts(self, books):
+        if not books:
+            return
+        if self.loaded:
+            for book_id, title, author, status in books:
+                self.books[book_id] = (title, author, status)
+        self.booksAdded.emit(list(books))
+
+    def applyDeletes(self, book_ids):
+        if not book_ids:
+            return
+        for book_id in book_ids:
+            self.books.pop(book_id, None)
+        self.booksRemoved.emit(list(book_ids))
+
+    def applyStatuses(self, changes):
+        if not changes:
+            return
+        for book_id, status in changes:
+            if book_id in self.books:
+                title, author, _ = self.books[book_id]
+                self.books[book_id] = (title, author, status)
+        self.booksChanged.emit(list(changes))
+
+    def applyInsert(self, book_id, title, author, status):
+        self.applyInserts([(book_id, title, author, status)])
+
+    def applyDelete(self, book_id):
+        self.applyDeletes([book_id])
+
+    def applyStatus(self, book_id, status):
+        self.applyStatuses([(book_id, status)])
+
+    def close(self):
+        if self.watcher is not None:
+            self.watcher.stop()
+
+
+# Проверка схемы и чтение каталога при запуске, пока открыто окно входа
+class CatalogPrefetch(QThread):
+    def __init__(self, service=None):
+        super().__init__()
+        self.service = service or LibraryService()
+        self.schemaReady = threading.Event()
+        self.books = None
+        self.seq = None
+        self.error = None
+
+    def run(self):
+        try:
+            self.service.init_db()
+            self.schemaReady.set()
+            # Номер журнала до чтения: изменения после него придут через ChangeWatcher
+            self.seq = self.service.change_seq()
+            self.books = self.service.search_books("")
+        except sqlite3.Error as e:
+            self.error = str(e)
+        finally:
+            self.schemaReady.set()
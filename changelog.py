@@ -0,0 +1,41 @@
+# Журнал изменений: триггеры записывают каждую вставку, изменение и удаление
+# в books и history с возрастающим номером seq. Открытые окна читают только
+# записи после последнего увиденного номера вместо перечитывания таблиц.
+# Таблицу, триггеры и чистку журнала создаёт миграция change_feed
+
+LOGGED_TABLES = ("books", "history")
+
+
+def last_seq(conn):
+    return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log").fetchone()[0]
+
+
+def first_seq(conn):
+    return conn.execute("SELECT MIN(seq) FROM change_log").fetchone()[0]
+
+
+def read(conn, after, limit):
+    # Возвращает (последний seq, {таблица: id строк}) не больше чем по limit записям
+    # после after или None, если часть из них уже вычищена — тогда нужна полная перезагрузка.
+    # Если последний seq не дошёл до конца журнала, читается следующая страница
+    first = first_seq(conn)
+    if first is not None and first > after + 1:
+        return None
+    rows = conn.execute("SELECT seq, tbl, row_id FROM change_log WHERE seq > ? ORDER BY seq LIMIT ?",
+                        (after, limit)).fetchall()
+    changed = {table: {} for table in LOGGED_TABLES}
+    for _, table, row_id in rows:
+        changed[table][row_id] = None  # dict сохраняет порядок и убирает повторы
+    return (rows[-1][0] if rows else after), {table: list(ids) for table, ids in changed.items()}
+
+
+def current_rows(conn, table, columns, ids):
+    # Актуальное состояние строк: (id, запись или None, если строка удалена).
+    # Первым в columns должен идти id
+    found = {}
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        placeholders = ", ".join("?" * len(chunk))
+        for row in conn.execute(f"SELECT {columns} FROM {table} WHERE id IN ({placeholders})", chunk):
+            found[row[0]] = row
+    return [(row_id, found.get(row_id)) for row_id in ids]
@@ -0,0 +1,105 @@
+import random
+import sqlite3
+import time
+from collections import namedtuple
+
+import db
+import loans
+import metrics
+from store import STATUS_AVAILABLE, STATUS_BORROWED
+
+RETRY_ATTEMPTS = 6
+RETRY_BACKOFF = 0.01  # секунды; удваивается с каждой попыткой
+
+BatchResult = namedtuple("BatchResult", "done failed")
+
+
+def is_busy(error):
+    message = str(error).lower()
+    return "locked" in message or "busy" in message
+
+
+# Выдача и возврат. Статус меняется условным UPDATE внутри BEGIN IMMEDIATE,
+# поэтому два терминала не могут выдать один экземпляр дважды
+def borrow(conn, username, book_id):
+    changed = conn.execute("UPDATE books SET status = ? WHERE id = ? AND status = ?",
+                           (STATUS_BORROWED, book_id, STATUS_AVAILABLE)).rowcount
+    if not changed:
+        return False  # Книга уже занята или не существует
+    conn.execute(f"""
+        INSERT INTO history (username, book_title, book_id, user_id, date_taken, date_returned, due_date)
+        SELECT ?, title, id, (SELECT id FROM users WHERE username = ?), datetime('now'), NULL, {loans.due_date()}
+        FROM books WHERE id = ?
+    """, (username, username, book_id))
+    return True
+
+
+def give_back(conn, book_id):
+    changed = conn.execute("UPDATE books SET status = ? WHERE id = ? AND status = ?",
+                           (STATUS_AVAILABLE, book_id, STATUS_BORROWED)).rowcount
+    if not changed:
+        return None  # Книга не выдана или не существует
+    conn.execute("UPDATE history SET date_returned = datetime('now') WHERE book_id = ? AND date_returned IS NULL",
+                 (book_id,))
+    # Забронированная книга в той же транзакции выдаётся первому в очереди,
+    # так что её не успеет взять кто-то другой. Возвращает статус книги после возврата
+    reader = loans.pop_next(conn, book_id)
+    if reader is not None and borrow(conn, reader, book_id):
+        return STATUS_BORROWED
+    return STATUS_AVAILABLE
+
+
+def batch(conn, operation, book_ids):
+    result = BatchResult([], [])
+    for book_id in book_ids:
+        (result.done if operation(conn, book_id) else result.failed).append(book_id)
+    return result
+
+
+def returned(conn, book_ids):
+    # Возврат пачки; в done — (id, статус после возврата): книга с очередью сразу снова занята
+    result = BatchResult([], [])
+    for book_id in book_ids:
+        status = give_back(conn, book_id)
+        if status is None:
+            result.failed.append(book_id)
+        else:
+            result.done.append((book_id, status))
+    return result
+
+
+class CheckoutEngine:
+    def __init__(self, attempts=RETRY_ATTEMPTS, backoff=RETRY_BACKOFF, pool=None):
+        self.attempts = attempts
+        self.backoff = backoff
+        self.pool = pool or db.pool  # пул базы, которой принадлежат книги
+
+    def run(self, operation, *args):
+        # При SQLITE_BUSY повторяем транзакцию с экспоненциальной задержкой
+        for attempt in range(self.attempts):
+            try:
+                with self.pool.transaction() as conn:
+                    return operation(conn, *args)
+            except sqlite3.OperationalError as e:
+                if not is_busy(e) or attempt == self.attempts - 1:
+                    raise
+                metrics.record("checkout_retry", attempt + 1)
+                time.sleep(self.backoff * 2 ** attempt * (1 + random.random()))
+
+    def borrow(self, username, book_id):
+        with metrics.timed("borrow"):
+            return self.run(borrow, username, book_id)
+
+    def give_back(self, book_id):
+        with metrics.timed("return"):
+            return self.run(give_back, book_id)
+
+    # Пакетные операции: все книги в одной транзакции и с одним коммитом
+
+    def borrow_many(self, username, book_ids):
+        with metrics.timed("borrow_many"):
+            return self.run(batch, lambda conn, book_id: borrow(conn, username, book_id), book_ids)
+
+    def return_many(self, book_ids):
+        with metrics.timed("return_many"):
+            return self.run(returned, book_ids)
@@ -0,0 +1,232 @@
+import argparse
+import sys
+
+import archive
+import db
+import transfer
+from branches import FederatedCatalog, parse_branch, branches_from_env
+from service import LibraryService
+
+# Командная строка для пакетных операций без графического интерфейса:
+#   python cli.py search Толстой
+#   python cli.py borrow ivan 12 15 18
+#   python cli.py return 12 15
+#   python cli.py import books books.csv
+#   python cli.py archive --age-days 365
+#   python cli.py --branch Центр=center.db --branch Север=north.db search Толстой
+#   python cli.py --branch Центр=center.db --branch Север=north.db --at Север borrow ivan 12
+
+
+def print_progress(count):
+    print(f"\r{count} строк", end="", file=sys.stderr)
+
+
+def cmd_search(service, args):
+    if args.branch:
+        # Общий поиск: потоки по филиалам, результаты с названием филиала
+        catalog = FederatedCatalog(args.branch)
+        try:
+            catalog.init_db()
+            for book in catalog.search(args.query):
+                print("\t".join(str(value) for value in book))
+        finally:
+            catalog.close()
+        return
+    books = service.search_books(args.query, args.fuzzy)
+    for row in range(len(books)):
+        book_id, title, author, status = books.book(row)
+        print(f"{book_id}\t{title}\t{author}\t{status}")
+
+
+def cmd_add(service, args):
+    print(service.add_book(args.title, args.author))
+
+
+def cmd_delete(service, args):
+    for book_id in service.delete_books(args.book_ids).failed:
+        print(f"Книга не найдена или выдана: {book_id}", file=sys.stderr)
+
+
+def cmd_borrow(service, args):
+    # Все книги выдаются одной транзакцией
+    for book_id in service.borrow_books(args.username, args.book_ids).failed:
+        print(f"Книга не найдена или уже выдана: {book_id}", file=sys.stderr)
+
+
+def cmd_return(service, args):
+    for book_id in service.return_books(args.book_ids).failed:
+        print(f"Книга не найдена или не выдана: {book_id}", file=sys.stderr)
+
+
+def cmd_reserve(service, args):
+    position = service.reserve(args.username, args.book_id)
+    if position is None:
+        sys.exit("Встать в очередь можно только на книгу, выданную другому читателю")
+    print(position)
+
+
+def cmd_cancel_reservation(service, args):
+    if not service.cancel_reservation(args.username, args.book_id):
+        sys.exit("Бронь не найдена")
+
+
+def cmd_queue(service, args):
+    for username, created in service.reservations(args.book_id):
+        print(f"{username}\t{created}")
+
+
+def cmd_overdue(service, args):
+    for record in service.overdue_loans(args.limit):
+        print("\t".join(str(value) for value in record))
+
+
+def cmd_register(service, args):
+    if not service.register(args.username, args.password):
+        sys.exit("Имя пользователя уже занято")
+
+
+def cmd_history(service, args):
+    records = service.history_page(args.query, args.filter, limit=args.limit)
+    # В архиве только возвращённые выдачи, они идут после оперативных записей
+    if args.archive and args.filter != "Не возвращена" and len(records) < args.limit:
+        records += service.search_archive(args.query, args.limit - len(records))
+    for record in records:
+        print("\t".join(str(value) for value in record))
+
+
+def cmd_archive(service, args):
+    count = service.archive_history(args.age_days, compress=not args.no_compress, progress=print_progress)
+    print(f"\nПеренесено в архив: {count}, всего в архиве: {service.archived_count()}", file=sys.stderr)
+
+
+def cmd_report(service, args):
+    report = service.report(args.limit, args.days)
+    print(f"На руках: {report['open']}, просрочено: {report['overdue']}")
+    print("\nПопулярные книги:")
+    for book_id, title, loans, open_loans in report["top_books"]:
+        print(f"{book_id}\t{title}\t{loans}\t{open_loans}")
+    print("\nЧитатели:")
+    for username, open_loans, loans in report["top_borrowers"]:
+        print(f"{username}\t{open_loans}\t{loans}")
+    print("\nПо дням:")
+    for day, checkouts, returns in report["daily"]:
+        print(f"{day}\t{checkouts}\t{returns}")
+
+
+def cmd_rebuild_stats(service, args):
+    service.rebuild_analytics(progress=lambda done, total: print(f"\r{done}/{total}", end="", file=sys.stderr))
+    print(file=sys.stderr)
+
+
+def cmd_import(service, args):
+    count = transfer.import_file(args.table, args.path, args.format, progress=print_progress)
+    print(f"\nИмпортировано строк: {count}", file=sys.stderr)
+
+
+def cmd_export(service, args):
+    count = transfer.export_table(args.table, args.path, args.format, progress=print_progress)
+    print(f"\nЭкспортировано строк: {count}", file=sys.stderr)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Библиотека: операции без графического интерфейса")
+    parser.add_argument("--db", default=db.DB_PATH, help="путь к файлу базы")
+    parser.add_argument("--branch", action="append", type=parse_branch, default=branches_from_env(),
+                        metavar="ИМЯ=ПУТЬ", help="база филиала для общего поиска (можно несколько раз)")
+    parser.add_argument("--at", metavar="ИМЯ", help="филиал, в базе которого выполнить команду")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("init", help="создать или обновить схему базы")
+    command.set_defaults(handler=lambda service, args: None)
+
+    command = commands.add_parser("search", help="поиск книг")
+    command.add_argument("query", nargs="?", default="")
+    command.add_argument("--fuzzy", action="store_true", help="нечёткий поиск с учётом опечаток")
+    command.set_defaults(handler=cmd_search)
+
+    command = commands.add_parser("delete", help="удалить книги")
+    command.add_argument("book_ids", nargs="+", type=int)
+    command.set_defaults(handler=cmd_delete)
+
+    command = commands.add_parser("add", help="добавить книгу")
+    command.add_argument("title")
+    command.add_argument("author")
+    command.set_defaults(handler=cmd_add)
+
+    command = commands.add_parser("borrow", help="выдать книги")
+    command.add_argument("username")
+    command.add_argument("book_ids", nargs="+", type=int)
+    command.set_defaults(handler=cmd_borrow)
+
+    command = commands.add_parser("return", help="вернуть книги")
+    command.add_argument("book_ids", nargs="+", type=int)
+    command.set_defaults(handler=cmd_return)
+
+    for name, handler, help_text in (("reserve", cmd_reserve, "встать в очередь на выданную книгу"),
+                                     ("cancel-reservation", cmd_cancel_reservation, "выйти из очереди")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument("username")
+        command.add_argument("book_id", type=int)
+        command.set_defaults(handler=handler)
+
+    command = commands.add_parser("queue", help="очередь на книгу")
+    command.add_argument("book_id", type=int)
+    command.set_defaults(handler=cmd_queue)
+
+    command = commands.add_parser("overdue", help="просроченные выдачи")
+    command.add_argument("--limit", type=int, default=100)
+    command.set_defaults(handler=cmd_overdue)
+
+    command = commands.add_parser("register", help="зарегистрировать пользователя")
+    command.add_argument("username")
+    command.add_argument("password")
+    command.set_defaults(handler=cmd_register)
+
+    command = commands.add_parser("history", help="история выдач")
+    command.add_argument("query", nargs="?", default="")
+    command.add_argument("--filter", default="Все", choices=["Все", "Не возвращена", "Возвращена"])
+    command.add_argument("--limit", type=int, default=100)
+    command.add_argument("--archive", action="store_true", help="искать и в архиве")
+    command.set_defaults(handler=cmd_history)
+
+    command = commands.add_parser("archive", help="перенести старые закрытые выдачи в архив")
+    command.add_argument("--age-days", type=int, default=archive.ARCHIVE_AGE_DAYS)
+    command.add_argument("--no-compress", action="store_true", help="хранить пачки без сжатия")
+    command.set_defaults(handler=cmd_archive)
+
+    command = commands.add_parser("report", help="отчёт о выдачах")
+    command.add_argument("--limit", type=int, default=10)
+    command.add_argument("--days", type=int, default=30)
+    command.set_defaults(handler=cmd_report)
+
+    command = commands.add_parser("rebuild-stats", help="пересчитать статистику по всей истории")
+    command.set_defaults(handler=cmd_rebuild_stats)
+
+    for name, handler, help_text in (("import", cmd_import, "импорт из CSV/JSONL"),
+                                     ("export", cmd_export, "экспорт в CSV/JSONL")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument("table", choices=list(transfer.TABLES))
+        command.add_argument("path")
+        command.add_argument("--format", choices=transfer.FORMATS)
+        command.set_defaults(handler=handler)
+
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.at:
+        # Выдачи и изменения идут в базу филиала, которому принадлежат книги
+        paths = dict(args.branch)
+        if args.at not in paths:
+            parser.error(f"неизвестный филиал: {args.at}")
+        args.db = paths[args.at]
+    db.configure(args.db)
+    service = LibraryService()
+    service.init_db()
+    args.handler(service, args)
+
+
+if __name__ == "__main__":
+    main()
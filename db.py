@@ -0,0 +1,337 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+import migrations
+
+# Путь к базе можно задать переменной окружения или аргументом --db
+DB_PATH = os.environ.get("LIBRARY_DB", "library.db")
+
+# Настройки соединения: WAL позволяет читать во время записи,
+# synchronous = NORMAL достаточно для WAL и экономит fsync на каждом коммите
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -16000",  # ~16 МБ страничного кэша
+    "PRAGMA mmap_size = 268435456",  # 256 МБ
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA foreign_keys = ON",
+)
+
+POOL_SIZE = 4  # сколько простаивающих соединений держать открытыми
+STATEMENT_CACHE_SIZE = 256  # кэш подготовленных выражений на соединение
+BUSY_TIMEOUT = 5.0
+
+# Счётчики для диагностики
+stats = {"connections_opened": 0, "statements_executed": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(key, n=1):
+    with _stats_lock:
+        stats[key] += n
+
+
+class Cursor(sqlite3.Cursor):
+    def execute(self, sql, params=()):
+        _count("statements_executed")
+        if not metrics.enabled:
+            return super().execute(sql, params)
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, params)
+        finally:
+            metrics.record_query(self.connection, sql, params, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_params):
+        _count("statements_executed")
+        if not metrics.enabled:
+            return super().executemany(sql, seq_of_params)
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_params)
+        finally:
+            metrics.record("sql_batch", (time.perf_counter() - start) * 1000)
+
+
+class Connection(sqlite3.Connection):
+    traced = False
+
+    def setTracing(self, enabled):
+        self.set_trace_callback(metrics.trace if enabled else None)
+        self.traced = enabled
+
+    def cursor(self, factory=Cursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+
+def connect(path=DB_PATH):
+    # isolation_level=None: транзакциями управляем сами через transaction()
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT, factory=Connection,
+                           cached_statements=STATEMENT_CACHE_SIZE,
+                           check_same_thread=False, isolation_level=None)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    _count("connections_opened")
+    return conn
+
+
+class ConnectionPool:
+    def __init__(self, path=DB_PATH, size=POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._version_conn = None
+
+    @contextmanager
+    def connection(self):
+        # Повторный вход в том же потоке получает то же соединение
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            yield conn
+            return
+
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = connect(self.path)
+        if conn.traced != metrics.enabled:
+            conn.setTracing(metrics.enabled)
+
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            if conn.in_transaction:
+                conn.rollback()
+            with self._lock:
+                if len(self._idle) < self.size:
+                    self._idle.append(conn)
+                    conn = None
+            if conn is not None:
+                conn.close()
+
+    @contextmanager
+    def transaction(self, immediate=True):
+        # По умолчанию BEGIN IMMEDIATE: запись захватывает блокировку сразу,
+        # а не при первом изменении, когда ожидание уже невозможно
+        with self.connection() as conn:
+            # Вложенный вызов присоединяется к внешней транзакции
+            if conn.in_transaction:
+                yield conn
+                return
+            conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    def data_version(self):
+        # PRAGMA data_version меняется после коммитов других соединений, но не своих.
+        # Отдельное соединение ничего не пишет, поэтому видит коммиты всех: и пула,
+        # и других процессов. Подходит как версия базы для кэшей
+        with self._lock:
+            if self._version_conn is None:
+                self._version_conn = connect(self.path)
+            return self._version_conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+            version_conn, self._version_conn = self._version_conn, None
+        for conn in idle:
+            conn.close()
+        if version_conn is not None:
+            version_conn.close()
+
+
+pool = ConnectionPool()
+
+
+def configure(path):
+    # Переключает пул на другой файл базы
+    pool.close()
+    pool.path = path
+
+
+def connection():
+    return pool.connection()
+
+
+def transaction(immediate=True):
+    return pool.transaction(immediate)
+
+
+def data_version():
+    return pool.data_version()
+
+
+def query(sql, params=()):
+    with pool.connection() as conn:
+        return conn.execute(sql, params).fetchall()
+
+
+def query_one(sql, params=()):
+    with pool.connection() as conn:
+        return conn.execute(sql, params).fetchone()
+
+
+def execute(sql, params=()):
+    with pool.transaction() as conn:
+        return conn.execute(sql, params)
+
+
+# Схема базы
+
+TABLES = (
+    """
+    CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL,
+    book_title TEXT NOT NULL,
+    date_taken TEXT NOT NULL,
+    date_returned TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS books (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title TEXT NOT NULL,
+    author TEXT NOT NULL,
+    status TEXT CHECK(status IN ('Доступна', 'Занята')) DEFAULT 'Доступна'
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT UNIQUE NOT NULL,
+    password TEXT NOT NULL,
+    role TEXT CHECK(role IN ('admin', 'guest')) DEFAULT 'guest'
+    )
+    """,
+)
+
+# Полнотекстовые индексы (FTS5) для поиска по книгам и истории.
+# unicode61 приводит к нижнему регистру и кириллицу, в отличие от LIKE
+FTS_TOKENIZER = "unicode61 remove_diacritics 2"
+
+FTS_SCHEMA = {
+    "books_fts": ("books", ("title", "author")),
+    "history_fts": ("history", ("username", "book_title")),
+}
+
+
+def create_fts(conn):
+    for fts_table, (table, columns) in FTS_SCHEMA.items():
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                              (fts_table,)).fetchone()
+        cols = ", ".join(columns)
+        new_cols = ", ".join(f"new.{c}" for c in columns)
+        old_cols = ", ".join(f"old.{c}" for c in columns)
+        conn.execute(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5(
+            {cols}, content='{table}', content_rowid='id',
+            tokenize='{FTS_TOKENIZER}', prefix='2 3'
+            )
+        """)
+        # Триггеры держат индекс в актуальном состоянии
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_fts_ai AFTER INSERT ON {table} BEGIN
+                INSERT INTO {fts_table}(rowid, {cols}) VALUES (new.id, {new_cols});
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_fts_ad AFTER DELETE ON {table} BEGIN
+                INSERT INTO {fts_table}({fts_table}, rowid, {cols}) VALUES ('delete', old.id, {old_cols});
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_fts_au AFTER UPDATE OF {cols} ON {table} BEGIN
+                INSERT INTO {fts_table}({fts_table}, rowid, {cols}) VALUES ('delete', old.id, {old_cols});
+                INSERT INTO {fts_table}(rowid, {cols}) VALUES (new.id, {new_cols});
+            END
+        """)
+        if not exists:
+            # Индекс для уже существующей базы строится один раз
+            conn.execute(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')")
+
+
+INDEXES = (
+    # Для постраничного вывода истории по ключу (date_taken, id)
+    "CREATE INDEX IF NOT EXISTS idx_history_date ON history(date_taken, id)",
+    "CREATE INDEX IF NOT EXISTS idx_history_open ON history(date_taken, id) WHERE date_returned IS NULL",
+)
+
+# Количество строк поддерживается триггерами, чтобы не выполнять COUNT(*)
+COUNTED_TABLES = ("books", "history")
+
+
+def create_counters(conn):
+    conn.execute("CREATE TABLE IF NOT EXISTS row_counts (name TEXT PRIMARY KEY, count INTEGER NOT NULL)")
+    for table in COUNTED_TABLES:
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_count_ai AFTER INSERT ON {table} BEGIN
+                UPDATE row_counts SET count = count + 1 WHERE name = '{table}';
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_count_ad AFTER DELETE ON {table} BEGIN
+                UPDATE row_counts SET count = count - 1 WHERE name = '{table}';
+            END
+        """)
+        if not conn.execute("SELECT 1 FROM row_counts WHERE name = ?", (table,)).fetchone():
+            conn.execute(f"INSERT INTO row_counts (name, count) SELECT ?, COUNT(*) FROM {table}", (table,))
+
+
+def init_db(target=None):
+    # target — пул другой базы, например филиала; по умолчанию основной пул.
+    # Схема проверяется один раз на версию: если user_version уже последняя,
+    # все объекты созданы тем же кодом, и запуск обходится без блокировки на запись.
+    # Поэтому любое изменение схемы оформляется новой миграцией
+    target = target or pool
+    with target.connection() as conn:
+        if migrations.schema_version(conn) == len(migrations.MIGRATIONS):
+            return False
+    with target.transaction() as conn:
+        for table in TABLES:
+            conn.execute(table)
+        migrations.migrate(conn)
+        for index in INDEXES:
+            conn.execute(index)
+        create_fts(conn)
+        create_counters(conn)
+    return True
+
+
+def row_count(table):
+    row = query_one("SELECT count FROM row_counts WHERE name = ?", (table,))
+    return row[0] if row else 0
+
+
+def matches(text, *fields):
+    # То же правило, что и у fts_query, но без индекса: каждое слово запроса —
+    # префикс одного из слов в полях записи
+    words = re.findall(r"\w+", " ".join(fields).casefold())
+    return all(any(word.startswith(token) for word in words)
+               for token in re.findall(r"\w+", text.casefold()))
+
+
+def fts_query(text):
+    # Каждое слово ищется по префиксу: "вой ми" -> "вой"* "ми"*
+    tokens = re.findall(r"\w+", text)
+    return " ".join(f'"{token}"*' for token in tokens)
@@ -0,0 +1,109 @@
+import time
+
+from PyQt5.QtCore import QObject, QTimer
+from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QTableWidget, QTableWidgetItem,
+                             QHeaderView, QPushButton, QCheckBox, QLabel, QPlainTextEdit)
+
+import db
+import metrics
+from service import history_cache
+
+STALL_CHECK_MS = 100
+STALL_THRESHOLD_MS = 200  # задержка таймера сверх этого считается зависанием GUI
+
+
+# Таймер срабатывает в GUI-потоке; если он опоздал, значит поток был занят
+class StallDetector(QObject):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.timer = QTimer(self)
+        self.timer.setInterval(STALL_CHECK_MS)
+        self.timer.timeout.connect(self.tick)
+        self.last = None
+
+    def setActive(self, active):
+        if active:
+            self.last = time.perf_counter()
+            self.timer.start()
+        else:
+            self.timer.stop()
+
+    def tick(self):
+        now = time.perf_counter()
+        late = (now - self.last) * 1000 - STALL_CHECK_MS
+        self.last = now
+        if late > STALL_THRESHOLD_MS:
+            metrics.record_stall(late)
+
+
+class DiagnosticsDialog(QDialog):
+    COLUMNS = ["Операция", "Вызовов", "p50, мс", "p95, мс", "p99, мс", "max, мс"]
+
+    def __init__(self, stall_detector=None, parent=None):
+        super().__init__(parent)
+        self.stall_detector = stall_detector
+        self.setWindowTitle("Диагностика")
+        self.setGeometry(300, 200, 800, 500)
+
+        layout = QVBoxLayout()
+
+        self.enabledCheckBox = QCheckBox("Собирать замеры")
+        self.enabledCheckBox.setChecked(metrics.enabled)
+        self.enabledCheckBox.toggled.connect(self.toggleMetrics)
+        layout.addWidget(self.enabledCheckBox)
+
+        self.table = QTableWidget()
+        self.table.setColumnCount(len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        layout.addWidget(self.table)
+
+        self.statsLabel = QLabel()
+        layout.addWidget(self.statsLabel)
+
+        layout.addWidget(QLabel("Медленные запросы:"))
+        self.slowQueries = QPlainTextEdit()
+        self.slowQueries.setReadOnly(True)
+        layout.addWidget(self.slowQueries)
+
+        buttons = QHBoxLayout()
+        refreshButton = QPushButton("Обновить")
+        refreshButton.clicked.connect(self.refresh)
+        buttons.addWidget(refreshButton)
+        resetButton = QPushButton("Сбросить")
+        resetButton.clicked.connect(self.reset)
+        buttons.addWidget(resetButton)
+        layout.addLayout(buttons)
+
+        self.setLayout(layout)
+        self.refresh()
+
+    def toggleMetrics(self, enabled):
+        metrics.enable(enabled)
+        if self.stall_detector is not None:
+            self.stall_detector.setActive(enabled)
+
+    def refresh(self):
+        snapshot = metrics.snapshot()
+        self.table.setRowCount(len(snapshot))
+        for row, (name, values) in enumerate(sorted(snapshot.items())):
+            cells = [name, str(values["count"])] + [f"{values[key]:.2f}" for key in ("p50", "p95", "p99", "max")]
+            for column, text in enumerate(cells):
+                self.table.setItem(row, column, QTableWidgetItem(text))
+
+        triggers = ", ".join(f"{name}: {count}" for name, count in metrics.top_triggers(5))
+        startup = ", ".join(f"{phase} {ms:.0f}" for phase, ms in metrics.startup.items())
+        self.statsLabel.setText(f"Соединений открыто: {db.stats['connections_opened']}, "
+                                f"выражений: {db.stats['statements_executed']}, "
+                                f"кэш истории: {history_cache.hits} попаданий, {history_cache.misses} промахов"
+                                + (f"; триггеры: {triggers}" if triggers else "")
+                                + (f"\nЗапуск, мс: {startup}" if startup else ""))
+
+        self.slowQueries.setPlainText("\n\n".join(
+            f"{entry['slow_query_ms']} мс: {entry['sql']}\n  " + "\n  ".join(entry["plan"])
+            for entry in reversed(metrics.slow_queries)))
+        metrics.log_snapshot()
+
+    def reset(self):
+        metrics.reset()
+        self.refresh()
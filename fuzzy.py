@@ -0,0 +1,69 @@
+import json
+import math
+import re
+
+# Нечёткий поиск по каталогу. Для каждой книги в book_trigrams хранятся
+# триграммы слов названия и автора. Триграммы считаются в Python, поэтому
+# триггеры на чистом SQL только ставят изменённые книги в очередь
+# book_trigrams_pending, а refresh() индексирует её в той же транзакции записи.
+# Книги, добавленные другими клиентами (sqlite3, старые версии), дождутся
+# ближайшего нечёткого поиска: он сначала разбирает очередь.
+# Кандидаты выбираются по индексу триграмм запроса, а не перебором каталога,
+# и ранжируются по доле совпавших триграмм: "Достаевский" находит "Достоевский"
+
+THRESHOLD = 0.5  # минимальная доля триграмм запроса, найденных у книги
+LIMIT = 200  # нечёткий поиск показывает только лучших кандидатов
+
+
+def trigrams(*fields):
+    # Слова дополняются пробелами, как в pg_trgm: "кот" -> "  к", " ко", "кот", "от "
+    found = set()
+    for word in re.findall(r"\w+", " ".join(fields).casefold().replace("ё", "е")):
+        padded = f"  {word} "
+        found.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return found
+
+
+def min_shared(count):
+    return max(1, math.ceil(count * THRESHOLD))
+
+
+def matches(text, *fields):
+    # То же правило, что и у search, для проверки одной записи без базы
+    wanted = trigrams(text)
+    return not wanted or len(wanted & trigrams(*fields)) >= min_shared(len(wanted))
+
+
+def stale(conn):
+    return conn.execute("SELECT 1 FROM book_trigrams_pending LIMIT 1").fetchone() is not None
+
+
+def refresh(conn):
+    # Индексирует книги из очереди; вызывается внутри транзакции записи
+    cursor = conn.execute("""
+        SELECT books.id, books.title, books.author FROM book_trigrams_pending
+        JOIN books ON books.id = book_trigrams_pending.book_id
+    """)
+    conn.executemany("INSERT OR IGNORE INTO book_trigrams (book_id, trigram) VALUES (?, ?)",
+                     ((book_id, trigram) for book_id, title, author in cursor
+                      for trigram in trigrams(title, author)))
+    conn.execute("DELETE FROM book_trigrams_pending")
+
+
+def search(conn, text, limit=LIMIT):
+    # Курсор (id, title, author, status): сначала книги с большим числом общих
+    # триграмм, при равенстве — с меньшим числом лишних (короче и точнее)
+    wanted = list(trigrams(text))
+    return conn.execute("""
+        SELECT books.id, books.title, books.author, books.status
+        FROM (
+            SELECT book_id, COUNT(*) AS shared FROM book_trigrams
+            WHERE trigram IN (SELECT value FROM json_each(?))
+            GROUP BY book_id HAVING COUNT(*) >= ?
+        ) AS hits
+        JOIN books ON books.id = hits.book_id
+        ORDER BY hits.shared DESC,
+                 (SELECT COUNT(*) FROM book_trigrams WHERE book_trigrams.book_id = hits.book_id),
+                 books.title
+        LIMIT ?
+    """, (json.dumps(wanted, ensure_ascii=False), min_shared(len(wanted)), limit))
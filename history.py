@@ -0,0 +1,134 @@
+from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QLineEdit, QComboBox, QTableView,
+                             QHeaderView, QLabel, QPushButton, QMessageBox, QFileDialog, QCheckBox)
+
+import archive
+import transfer
+from models import HistoryTableModel
+from service import LibraryService
+from transfer_dialog import TRANSFER_FILTER, run_transfer, report_transfer
+
+
+class HistoryWindow(QDialog):
+    def __init__(self, changes=None, overdue=None):
+        super().__init__()
+        self.setWindowTitle("История взятых книг")
+        self.setGeometry(400, 200, 800, 500)
+        self.service = LibraryService()
+
+        layout = QVBoxLayout()
+        
+        # Поиск и фильтрация
+        search_layout = QHBoxLayout()
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("Поиск по пользователю или книге")
+        self.search_input.textChanged.connect(self.load_history)
+        
+        self.filter_combo = QComboBox()
+        self.filter_combo.addItems(["Все", "Не возвращена", "Возвращена"])
+        self.filter_combo.currentIndexChanged.connect(self.load_history)
+        
+        # Архив просматривается целиком, поэтому только по явному запросу
+        self.archive_check = QCheckBox("Искать в архиве")
+        self.archive_check.toggled.connect(self.load_history)
+        self.archived = 0
+
+        search_layout.addWidget(self.search_input)
+        search_layout.addWidget(self.filter_combo)
+        search_layout.addWidget(self.archive_check)
+        layout.addLayout(search_layout)
+
+        # Таблица: следующие записи подгружаются в фоне при прокрутке
+        self.model = HistoryTableModel(self)
+        self.model.rowsInserted.connect(self.update_count)
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.setSelectionBehavior(QTableView.SelectRows)
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        layout.addWidget(self.table)
+
+        self.count_label = QLabel()
+        layout.addWidget(self.count_label)
+
+        # Кнопки
+        button_layout = QHBoxLayout()
+        self.delete_button = QPushButton("Удалить запись")
+        self.delete_button.clicked.connect(self.delete_record)
+        button_layout.addWidget(self.delete_button)
+
+        self.export_button = QPushButton("Экспорт в CSV")
+        self.export_button.clicked.connect(self.export_to_csv)
+        button_layout.addWidget(self.export_button)
+
+        self.archive_button = QPushButton("Перенести старые в архив")
+        self.archive_button.clicked.connect(self.archive_old)
+        button_layout.addWidget(self.archive_button)
+
+        layout.addLayout(button_layout)
+        self.setLayout(layout)
+
+        self.load_history()
+
+        # Записи с других терминалов появляются в открытом окне без перечитывания
+        if changes is not None:
+            changes.historyChanged.connect(self.apply_changes)
+            changes.resync.connect(self.load_history)
+        if overdue is not None:
+            # Подсветка обновляется по мере истечения сроков, без перечитывания
+            overdue.becameOverdue.connect(self.mark_overdue)
+
+    def apply_changes(self, changes):
+        self.model.applyChanges(changes)
+
+    def mark_overdue(self, loans):
+        self.model.markOverdue([loan[0] for loan in loans])
+        self.update_count()
+
+    def load_history(self):
+        include_archive = self.archive_check.isChecked()
+        self.archived = self.service.archived_count() if include_archive else 0
+        self.model.setQuery(self.search_input.text(), self.filter_combo.currentText(), include_archive)
+        self.update_count()
+
+    def update_count(self):
+        # Общее число берётся из счётчика, поддерживаемого триггерами
+        text = f"Показано: {self.model.rowCount()} из ~{self.service.history_count()}"
+        if self.archived:
+            text += f" и {self.archived} в архиве"
+        self.count_label.setText(text)
+
+    def delete_record(self):
+        index = self.table.currentIndex()
+        if not index.isValid():
+            QMessageBox.warning(self, 'Ошибка', 'Выберите запись для удаления.')
+            return
+
+        if self.model.isArchived(index.row()):
+            QMessageBox.warning(self, 'Ошибка', 'Записи в архиве не удаляются.')
+            return
+
+        record_id, username, book_title = self.model.recordAt(index.row())[:3]
+        reply = QMessageBox.question(self, 'Подтверждение', f'Удалить запись о книге "{book_title}" пользователя {username}?', QMessageBox.Yes | QMessageBox.No)
+        
+        if reply == QMessageBox.Yes:
+            self.service.delete_history_record(record_id)
+            self.model.removeRecord(index.row())
+            self.update_count()
+
+    def export_to_csv(self):
+        # Экспортируется вся таблица истории, а не только загруженные строки
+        path, _ = QFileDialog.getSaveFileName(self, "Экспорт истории", "book_history.csv", TRANSFER_FILTER)
+        if not path:
+            return
+        worker = run_transfer(self, "Экспорт истории", transfer.export_table, "history", path)
+        report_transfer(self, worker, "История успешно экспортирована!")
+
+    def archive_old(self):
+        reply = QMessageBox.question(self, 'Подтверждение',
+                                     f'Перенести в архив выдачи, возвращённые больше {archive.ARCHIVE_AGE_DAYS} дней назад?',
+                                     QMessageBox.Yes | QMessageBox.No)
+        if reply != QMessageBox.Yes:
+            return
+        # Перенос идёт в фоне короткими транзакциями; отмена сохраняет уже перенесённое
+        worker = run_transfer(self, "Перенос в архив", self.service.archive_history)
+        report_transfer(self, worker, "Записи перенесены в архив.")
+        self.load_history()
@@ -0,0 +1,74 @@
+# Сроки возврата и очередь бронирования. У каждой выдачи есть due_date;
+# частичный индекс по due_date открытых выдач отвечает на вопрос "что просрочено"
+# без просмотра всех выдач. Занятую книгу можно забронировать: при возврате
+# она сразу выдаётся первому в очереди (см. checkout.give_back)
+
+LOAN_DAYS = 14  # срок выдачи по умолчанию; столько же подставляет триггер history_due_ai
+
+# Текущее время в формате datetime('now') SQLite, сравнивается как строка
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def due_date(loan_days=LOAN_DAYS):
+    # Выражение для INSERT в history
+    return f"datetime('now', '+{loan_days} days')"
+
+
+def queue_position(conn, username, book_id):
+    # Номер в очереди, начиная с 1, или None
+    row = conn.execute("""
+        SELECT (SELECT COUNT(*) FROM reservations AS ahead WHERE ahead.book_id = mine.book_id AND ahead.id <= mine.id)
+        FROM reservations AS mine WHERE mine.book_id = ? AND mine.username = ?
+    """, (book_id, username)).fetchone()
+    return row[0] if row else None
+
+
+def reserve(conn, username, book_id):
+    # Бронировать можно только выданную книгу и не тому, у кого она на руках.
+    # Возвращает номер в очереди или None
+    holder = conn.execute("""
+        SELECT history.username FROM books
+        JOIN history ON history.book_id = books.id AND history.date_returned IS NULL
+        WHERE books.id = ? AND books.status = 'Занята'
+    """, (book_id,)).fetchone()
+    if holder is None or holder[0] == username:
+        return None
+    conn.execute("""
+        INSERT OR IGNORE INTO reservations (book_id, user_id, username, created)
+        VALUES (?, (SELECT id FROM users WHERE username = ?), ?, datetime('now'))
+    """, (book_id, username, username))
+    return queue_position(conn, username, book_id)
+
+
+def cancel(conn, username, book_id):
+    return conn.execute("DELETE FROM reservations WHERE book_id = ? AND username = ?",
+                        (book_id, username)).rowcount > 0
+
+
+def pop_next(conn, book_id):
+    # Имя первого в очереди; его бронь снимается
+    row = conn.execute("SELECT id, username FROM reservations WHERE book_id = ? ORDER BY id LIMIT 1",
+                       (book_id,)).fetchone()
+    if row is None:
+        return None
+    conn.execute("DELETE FROM reservations WHERE id = ?", (row[0],))
+    return row[1]
+
+
+def queue(conn, book_id):
+    return conn.execute("SELECT username, created FROM reservations WHERE book_id = ? ORDER BY id",
+                        (book_id,)).fetchall()
+
+
+def overdue(conn, limit=100):
+    # Только просроченные открытые выдачи: диапазон частичного индекса idx_history_due
+    return conn.execute("""
+        SELECT id, username, book_title, due_date FROM history
+        WHERE date_returned IS NULL AND due_date < datetime('now')
+        ORDER BY due_date LIMIT ?
+    """, (limit,)).fetchall()
+
+
+def overdue_count(conn):
+    return conn.execute("SELECT COUNT(*) FROM history WHERE date_returned IS NULL AND due_date < datetime('now')"
+                        ).fetchone()[0]
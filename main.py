@@ -1,32 +1,28 @@
 import sys
+import time
+
+STARTED = time.perf_counter()  # отсчёт для отчёта о времени запуска
+
+import argparse
 import sqlite3
-import csv
-from PyQt5.QtWidgets import (QApplication, QWidget, QVBoxLayout, QPushButton, QTableWidget, 
-                             QTableWidgetItem, QMessageBox, QLineEdit, QLabel, QHBoxLayout, 
-                             QHeaderView, QComboBox, QDialog)
-from PyQt5.QtCore import QThread, pyqtSignal
-from PyQt5.QtGui import QColor
-
-# Поток для работы с БД
-class DatabaseWorker(QThread):
-    booksLoaded = pyqtSignal(list)
-
-    def __init__(self, search_query=""):
-        super().__init__()
-        self.search_query = search_query
-    
-    def run(self):
-        conn = sqlite3.connect("library.db")
-        cursor = conn.cursor()
-        query = "SELECT title, author, status FROM books"
-        params = ()
-        if self.search_query:
-            query += " WHERE title LIKE ? OR author LIKE ?"
-            params = (f'%{self.search_query}%', f'%{self.search_query}%')
-        cursor.execute(query, params)
-        books = cursor.fetchall()
-        conn.close()
-        self.booksLoaded.emit(books)
+from PyQt5.QtWidgets import (QApplication, QWidget, QVBoxLayout, QPushButton, QMessageBox, QLineEdit,
+                             QLabel, QHBoxLayout, QHeaderView, QComboBox, QDialog, QTableView, QFileDialog,
+                             QCheckBox, QInputDialog)
+from PyQt5.QtCore import QTimer
+
+import db
+import fuzzy
+import metrics
+from branches import FederatedCatalog, parse_branch, branches_from_env
+from auth import LoginThrottled
+from service import LibraryService, NOT_RETURNED
+from models import BookTableModel, BookFilterProxyModel
+from search import SearchPipeline
+from catalog import CatalogCache, CatalogPrefetch
+from overdue import OverdueScheduler
+from diagnostics import StallDetector, DiagnosticsDialog
+
+# Окна истории, отчётов и импорта вместе с csv импортируются при первом открытии
 
 class LoginDialog(QDialog):
     def __init__(self):
@@ -50,14 +46,24 @@ class LoginDialog(QDialog):
         return "admin" if self.roleComboBox.currentText() == "Админ" else "guest"
 
 class LibraryApp(QWidget):
-    def __init__(self, user_role, username):
+    def __init__(self, user_role, username, session=None, prefetch=None, branches=None):
         super().__init__()
+        self.branches = branches  # FederatedCatalog, если заданы филиалы
         self.user_role = user_role  # "admin" или "guest"
         self.username = username  # Сохраняем имя пользователя
+        self.session = session  # Токен сессии из auth.sessions
+        self.service = LibraryService()
         self.user_role = user_role  # Возможные роли: "admin", "guest"
         self.initUI()
-        self.initDB()
-        self.loadBooks()
+        if prefetch is None:
+            self.catalog.watch(self.initDB())
+            self.loadBooks()
+        else:
+            # Схема уже проверена, а каталог прочитан, пока пользователь входил
+            self.catalog.watch(prefetch.seq)
+            self.catalog.replace(prefetch.books)
+            self.displayBooks(prefetch.books)
+        self.watchLoans()
         self.updateUI()
 
     def initUI(self):
@@ -66,18 +72,50 @@ class LibraryApp(QWidget):
         
         layout = QVBoxLayout()
         
+        searchLayout = QHBoxLayout()
         self.searchInput = QLineEdit(self)
         self.searchInput.setPlaceholderText("Поиск по названию или автору")
         self.searchInput.textChanged.connect(self.searchBooks)
-        layout.addWidget(self.searchInput)
-        
-        self.table = QTableWidget()
-        self.table.setColumnCount(3)
-        self.table.setHorizontalHeaderLabels(['Название', 'Автор', 'Статус'])
+        searchLayout.addWidget(self.searchInput)
+        self.fuzzyCheck = QCheckBox("С опечатками", self)
+        self.fuzzyCheck.toggled.connect(self.setFuzzy)
+        searchLayout.addWidget(self.fuzzyCheck)
+        layout.addLayout(searchLayout)
+        
+        # Поиск с задержкой ввода и отменой устаревших запросов
+        self.search = SearchPipeline(parent=self)
+        self.search.booksLoaded.connect(self.onBooksLoaded)
+        self.search.searchFailed.connect(lambda message: QMessageBox.critical(self, "Ошибка базы данных", message))
+        
+        self.statusFilter = QComboBox(self)
+        self.statusFilter.addItems(["Все", "Доступна", "Занята"])
+        self.statusFilter.currentTextChanged.connect(self.filterBooks)
+        layout.addWidget(self.statusFilter)
+        
+        self.overdueLabel = QLabel(self)
+        layout.addWidget(self.overdueLabel)
+        
+        # Модель отдаёт представлению только видимые строки
+        self.model = BookTableModel(self)
+        self.proxy = BookFilterProxyModel(self)
+        self.proxy.setSourceModel(self.model)
+        
+        self.table = QTableView()
+        self.table.setModel(self.proxy)
+        self.table.setSelectionBehavior(QTableView.SelectRows)
+        self.table.setSelectionMode(QTableView.ExtendedSelection)  # пакетные операции над выбранными
         self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)  # без пересчёта высоты каждой строки
         self.table.setSortingEnabled(True)
         layout.addWidget(self.table)
         
+        # Изменения каталога, свои и с других терминалов, приходят в таблицу точечно
+        self.catalog = CatalogCache(parent=self)
+        self.catalog.booksAdded.connect(self.onBooksAdded)
+        self.catalog.booksRemoved.connect(self.model.removeBooks)
+        self.catalog.booksChanged.connect(self.model.setBookStatuses)
+        self.catalog.externalChange.connect(self.loadBooks)
+        
         addLayout = QHBoxLayout()
         self.bookInput = QLineEdit(self)
         self.authorInput = QLineEdit(self)
@@ -96,11 +134,28 @@ class LibraryApp(QWidget):
         self.addButton.setStyleSheet("background-color: green; color: white; font-weight: bold;")
         layout.addWidget(self.addButton)
         
+        # Пакетные операции выполняются в фоне короткими транзакциями
+        bulkLayout = QHBoxLayout()
+        self.pasteButton = QPushButton('Добавить списком', self)
+        self.pasteButton.clicked.connect(self.pasteBooks)
+        bulkLayout.addWidget(self.pasteButton)
+        self.markBorrowedButton = QPushButton('Выдать выбранные', self)
+        self.markBorrowedButton.clicked.connect(lambda: self.setSelectedStatus('Занята'))
+        bulkLayout.addWidget(self.markBorrowedButton)
+        self.markAvailableButton = QPushButton('Вернуть выбранные', self)
+        self.markAvailableButton.clicked.connect(lambda: self.setSelectedStatus('Доступна'))
+        bulkLayout.addWidget(self.markAvailableButton)
+        layout.addLayout(bulkLayout)
+        
         self.borrowButton = QPushButton('Взять/Вернуть книгу', self)
         self.borrowButton.clicked.connect(self.toggleStatus)
         # self.borrowButton.setStyleSheet("background-color: yellow; color: white; font-weight: bold;")
         layout.addWidget(self.borrowButton)
         
+        self.reserveButton = QPushButton('Встать в очередь', self)
+        self.reserveButton.clicked.connect(self.reserveBook)
+        layout.addWidget(self.reserveButton)
+        
         self.historyButton = QPushButton("История книг", self)
         self.historyButton.clicked.connect(self.open_history)
         layout.addWidget(self.historyButton)
@@ -111,10 +166,30 @@ class LibraryApp(QWidget):
         layout.addWidget(self.deleteButton)
         
         self.refreshButton = QPushButton('Обновить список', self)
-        self.refreshButton.clicked.connect(self.loadBooks)
+        self.refreshButton.clicked.connect(lambda: self.loadBooks())
         # self.refreshButton.setStyleSheet("background-color: blue; color: white; font-weight: bold;")
         layout.addWidget(self.refreshButton)
         
+        self.importButton = QPushButton('Импорт книг', self)
+        self.importButton.clicked.connect(self.importBooks)
+        layout.addWidget(self.importButton)
+        
+        self.reportsButton = QPushButton('Отчёты', self)
+        self.reportsButton.clicked.connect(self.open_reports)
+        layout.addWidget(self.reportsButton)
+
+        self.diagnosticsButton = QPushButton('Диагностика', self)
+        self.diagnosticsButton.clicked.connect(self.open_diagnostics)
+        layout.addWidget(self.diagnosticsButton)
+        
+        # Обнаружение зависаний GUI-потока работает только при включённых замерах
+        self.stallDetector = StallDetector(self)
+        self.stallDetector.setActive(metrics.enabled)
+        
+        self.branchesButton = QPushButton('Поиск по филиалам', self)
+        self.branchesButton.clicked.connect(self.open_branches)
+        layout.addWidget(self.branchesButton)
+        
         self.logoutButton = QPushButton('Выйти из аккаунта', self)
         self.logoutButton.clicked.connect(self.logout)
         self.logoutButton.setStyleSheet("background-color: brown; color: white; font-weight: bold;")
@@ -125,54 +200,82 @@ class LibraryApp(QWidget):
         self.setLayout(layout)
 
     def initDB(self):
+        # Возвращает номер журнала изменений, с которого следить за базой
         try:
-            conn = sqlite3.connect("library.db")
-            cursor = conn.cursor()
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT NOT NULL,
-                book_title TEXT NOT NULL,
-                date_taken TEXT NOT NULL,
-                date_returned TEXT
-                )
-            """)
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS books (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                title TEXT NOT NULL,
-                author TEXT NOT NULL,
-                status TEXT CHECK(status IN ('Доступна', 'Занята')) DEFAULT 'Доступна'
-                )
-            """)
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                password TEXT NOT NULL,
-                role TEXT CHECK(role IN ('admin', 'guest')) DEFAULT 'guest'
-                )
-            """)
-            conn.commit()
+            self.service.init_db()
+            return self.service.change_seq()
         except sqlite3.Error as e:
             QMessageBox.critical(self, "Ошибка базы данных", str(e))
-        finally:
-            conn.close()
     
-    def loadBooks(self, search_query=""):
-        if hasattr(self, 'worker') and self.worker.isRunning():
-            self.worker.terminate()  # Останавливаем предыдущий поток, если он запущен
+    def watchLoans(self):
+        # Новые выдачи приходят планировщику из журнала изменений
+        self.overdue = OverdueScheduler(self)
+        self.overdue.becameOverdue.connect(self.showOverdue)
+        self.catalog.watcher.historyChanged.connect(self.onHistoryChanged)
+        self.overdue.start()
+        self.showOverdue()
+    
+    def onHistoryChanged(self, changes):
+        self.overdue.schedule([record_id for record_id, record in changes
+                               if record is not None and record[4] == NOT_RETURNED])
+        self.showOverdue()
+    
+    def showOverdue(self, loans=None):
+        # Счётчик читает только просроченные записи частичного индекса
+        self.overdueLabel.setText(f"Просроченных выдач: {self.service.overdue_count()}")
+    
+    def loadBooks(self):
+        search_query = self.searchInput.text()
+        if not search_query and self.catalog.loaded:
+            self.search.cancel()
+            self.displayBooks(self.catalog.store())
+        else:
+            self.search.submit(search_query, immediate=True)
+    
+    def onBooksLoaded(self, books):
+        if not self.search.pending:
+            self.catalog.replace(books)  # Полный каталог — запоминаем в кэше
+        self.displayBooks(books)
+    
+    def setFuzzy(self, enabled):
+        self.search.fuzzy = enabled
+        if self.searchInput.text():
+            self.loadBooks()
 
-        self.worker = DatabaseWorker(search_query)
-        self.worker.booksLoaded.connect(self.displayBooks)
-        self.worker.start()
+    def onBooksAdded(self, books):
+        matches = fuzzy.matches if self.search.fuzzy else db.matches
+        text = self.searchInput.text()
+        self.model.insertBooks([book for book in books if matches(text, book[1], book[2])])
     
     def displayBooks(self, books):
-        self.table.setRowCount(0)
-        for row_idx, row_data in enumerate(books):
-            self.table.insertRow(row_idx)
-            for col_idx, col_data in enumerate(row_data):
-                self.table.setItem(row_idx, col_idx, QTableWidgetItem(str(col_data)))
+        with metrics.timed("displayBooks"):
+            self.model.setBooks(books)
+            header = self.table.horizontalHeader()
+            if header.sortIndicatorSection() >= 0:
+                self.model.sort(header.sortIndicatorSection(), header.sortIndicatorOrder())
+    
+    def filterBooks(self, status):
+        self.proxy.setStatusFilter(None if status == "Все" else status)
+    
+    def selectedBook(self):
+        index = self.table.currentIndex()
+        if not index.isValid():
+            return None
+        return self.proxy.bookAt(index.row())
+    
+    def selectedBooks(self):
+        # Выделение хранится диапазонами; при "выделить всё" это один диапазон
+        return [self.proxy.bookAt(row) for selected in self.table.selectionModel().selection()
+                for row in range(selected.top(), selected.bottom() + 1)]
+    
+    def runBulk(self, title, operation, *args):
+        # BatchResult операции; при ошибке уже закоммиченные пачки придут через журнал изменений
+        from transfer_dialog import run_transfer
+        worker = run_transfer(self, title, operation, *args)
+        if worker.error:
+            QMessageBox.critical(self, "Ошибка базы данных", worker.error)
+            return None
+        return worker.count
     
     def addBook(self):
         if self.user_role != "admin":
@@ -180,12 +283,8 @@ class LibraryApp(QWidget):
             return
         title, author, status = self.bookInput.text(), self.authorInput.text(), self.statusComboBox.currentText()
         if title and author:
-            conn = sqlite3.connect("library.db")
-            cursor = conn.cursor()
-            cursor.execute("INSERT INTO books (title, author, status) VALUES (?, ?, ?)", (title, author, status))
-            conn.commit()
-            conn.close()
-            self.loadBooks()
+            book_id = self.service.add_book(title, author, status)
+            self.catalog.applyInsert(book_id, title, author, status)
             self.bookInput.clear()
             self.authorInput.clear()
         else:
@@ -196,100 +295,186 @@ class LibraryApp(QWidget):
             QMessageBox.warning(self, 'Ошибка', 'У вас нет прав на удаление книг')
             return
         
-        selected_row = self.table.currentRow()
-        if selected_row == -1:
+        books = self.selectedBooks()
+        if not books:
             QMessageBox.warning(self, 'Ошибка', 'Выберите книгу для удаления')
             return
+        if len(books) > 1:
+            self.deleteBooks([book[0] for book in books])
+            return
         
-        title = self.table.item(selected_row, 0).text()
+        book_id, title = books[0][:2]
         reply = QMessageBox.question(self, 'Подтверждение', f'Удалить книгу "{title}"?', QMessageBox.Yes | QMessageBox.No)
         
         if reply == QMessageBox.Yes:
-            conn = sqlite3.connect("library.db")  # Создаём соединение
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM books WHERE title = ?", (title,))
-            conn.commit()
-            conn.close()
-            self.loadBooks()
+            if self.service.delete_book(book_id):
+                self.catalog.applyDelete(book_id)
+            else:
+                QMessageBox.warning(self, 'Ошибка', 'Книга выдана или уже удалена: сначала оформите возврат')
+
+    def deleteBooks(self, book_ids):
+        reply = QMessageBox.question(self, 'Подтверждение', f'Удалить выбранные книги ({len(book_ids)})?',
+                                     QMessageBox.Yes | QMessageBox.No)
+        if reply != QMessageBox.Yes:
+            return
+        # Большое выделение пересчитывается представлением при каждом удалении строк
+        self.table.clearSelection()
+        result = self.runBulk("Удаление книг", self.service.delete_books, book_ids)
+        if result:
+            self.catalog.applyDeletes(result.done)
+            if result.failed:
+                QMessageBox.warning(self, 'Ошибка', f'Не удалены выданные или уже удалённые книги: {len(result.failed)}')
 
-    def toggleStatus(self):
-        selected_row = self.table.currentRow()
-        if selected_row == -1:
-            QMessageBox.warning(self, 'Ошибка', 'Выберите книгу')
+    def setSelectedStatus(self, status):
+        if self.user_role != "admin":
+            QMessageBox.warning(self, 'Ошибка', 'У вас нет прав на пакетные операции')
+            return
+        book_ids = [book[0] for book in self.selectedBooks() if book[3] != status]
+        if not book_ids:
+            QMessageBox.warning(self, 'Ошибка', 'Выберите книги с другим статусом')
             return
+        result = self.runBulk("Смена статуса", self.service.set_status, self.username, book_ids, status)
+        if result:
+            self.catalog.applyStatuses(result.done)
+            if result.failed:
+                # Эти книги успели изменить с другого терминала; актуальный статус придёт из журнала
+                QMessageBox.warning(self, 'Ошибка', f'Статус уже изменён другим пользователем: {len(result.failed)}')
 
-        title = self.table.item(selected_row, 0).text()
-        current_status = self.table.item(selected_row, 2).text()
-        new_status = 'Доступна' if current_status == 'Занята' else 'Занята'
+    def pasteBooks(self):
+        if self.user_role != "admin":
+            QMessageBox.warning(self, 'Ошибка', 'У вас нет прав на добавление книг')
+            return
+        import transfer
+        text, ok = QInputDialog.getMultiLineText(self, 'Добавить списком',
+                                                 'По книге в строке: название и автор через табуляцию или ";"')
+        if not ok:
+            return
+        try:
+            books = transfer.read_pasted(text)
+        except ValueError as e:
+            QMessageBox.warning(self, 'Ошибка', str(e))
+            return
+        if not books:
+            return
+        result = self.runBulk("Добавление книг", self.service.add_books, books, self.statusComboBox.currentText())
+        if result:
+            self.catalog.applyInserts(result.done)
 
-        conn = sqlite3.connect("library.db")
-        cursor = conn.cursor()
+    def reserveBook(self):
+        book = self.selectedBook()
+        if book is None:
+            QMessageBox.warning(self, 'Ошибка', 'Выберите книгу')
+            return
+        book_id, title = book[:2]
+        position = self.service.queue_position(self.username, book_id)
+        if position is not None:
+            reply = QMessageBox.question(self, 'Очередь', f'Вы {position}-й в очереди на "{title}". Выйти из очереди?',
+                                         QMessageBox.Yes | QMessageBox.No)
+            if reply == QMessageBox.Yes:
+                self.service.cancel_reservation(self.username, book_id)
+            return
+        position = self.service.reserve(self.username, book_id)
+        if position is None:
+            QMessageBox.warning(self, 'Ошибка', 'Встать в очередь можно только на книгу, выданную другому читателю')
+            return
+        # При возврате книга будет сразу выдана первому в очереди
+        QMessageBox.information(self, 'Очередь', f'Вы {position}-й в очереди на "{title}"')
 
-        if new_status == "Занята":
-            cursor.execute("INSERT INTO history (username, book_title, date_taken) VALUES (?, ?, datetime('now'))", 
-                        (self.username, title))
+    def toggleStatus(self):
+        book = self.selectedBook()
+        if book is None:
+            QMessageBox.warning(self, 'Ошибка', 'Выберите книгу')
+            return
+
+        book_id, _, _, current_status = book
+        new_status, changed = self.service.toggle_status(self.username, book_id, current_status)
+        if changed:
+            self.catalog.applyStatus(book_id, new_status)
+            return
+        # Статус успели изменить с другого терминала — показываем актуальный
+        actual = self.service.book_status(book_id)
+        if actual is None:
+            self.catalog.applyDelete(book_id)
         else:
-            cursor.execute("UPDATE history SET date_returned = datetime('now') WHERE book_title = ? AND username = ? AND date_returned IS NULL", 
-                        (title, self.username))
+            self.catalog.applyStatus(book_id, actual)
+        QMessageBox.warning(self, 'Ошибка', 'Статус книги уже изменён другим пользователем')
+        
+    def borrow_book(self, username, book_id):
+        if self.service.borrow_book(username, book_id):
+            self.catalog.applyStatus(book_id, 'Занята')
 
-        cursor.execute("UPDATE books SET status = ? WHERE title = ?", (new_status, title))
-        conn.commit()
-        conn.close()
+    def return_book(self, book_id):
+        status = self.service.return_book(book_id)
+        if status:
+            self.catalog.applyStatus(book_id, status)
 
+    def importBooks(self):
+        if self.user_role != "admin":
+            QMessageBox.warning(self, 'Ошибка', 'У вас нет прав на добавление книг')
+            return
+        import transfer
+        from transfer_dialog import TRANSFER_FILTER, run_transfer, report_transfer
+        path, _ = QFileDialog.getOpenFileName(self, "Импорт книг", "", TRANSFER_FILTER)
+        if not path:
+            return
+        worker = run_transfer(self, "Импорт книг", transfer.import_file, "books", path)
+        report_transfer(self, worker, "Книги импортированы.")
         self.loadBooks()
-        
-    def borrow_book(self, username, book_title):
-        conn = sqlite3.connect("library.db")
-        cursor = conn.cursor()
 
-        # Добавляем запись о взятии книги
-        cursor.execute("INSERT INTO history (username, book_title, date_taken, date_returned) VALUES (?, ?, datetime('now'), NULL)", 
-                    (username, book_title))
-
-        # Обновляем статус книги
-        cursor.execute("UPDATE books SET status = 'Занята' WHERE title = ?", (book_title,))
-        
-        conn.commit()
-        conn.close()
+    def open_history(self):
+        from history import HistoryWindow
+        self.history_window = HistoryWindow(self.catalog.watcher, self.overdue)
+        self.history_window.exec_()
 
-    def return_book(self, username, book_title):
-        conn = sqlite3.connect("library.db")
-        cursor = conn.cursor()
+    def open_reports(self):
+        from reports import ReportsDialog
+        self.reports_window = ReportsDialog(self)
+        self.reports_window.exec_()
 
-        # Обновляем запись, указывая дату возврата
-        cursor.execute("""
-            UPDATE history 
-            SET date_returned = datetime('now') 
-            WHERE username = ? AND book_title = ? AND date_returned IS NULL
-        """, (username, book_title))
+    def open_diagnostics(self):
+        self.diagnostics_window = DiagnosticsDialog(self.stallDetector, self)
+        self.diagnostics_window.exec_()
 
-        # Обновляем статус книги
-        cursor.execute("UPDATE books SET status = 'Доступна' WHERE title = ?", (book_title,))
-        
-        conn.commit()
-        conn.close()
-
-    def open_history(self):
-        self.history_window = HistoryWindow()
-        self.history_window.exec_()
+    def open_branches(self):
+        from branch_search import BranchSearchDialog
+        self.branches_window = BranchSearchDialog(self.branches, self.username, self)
+        self.branches_window.exec_()
 
     def closeEvent(self, event):
-        conn = sqlite3.connect("library.db")
-        conn.close()
+        metrics.log_snapshot()
+        self.stallDetector.setActive(False)
+        self.catalog.close()
+        self.overdue.stop()
+        db.pool.close()  # Закрываем простаивающие соединения пула
+        if self.branches is not None:
+            self.branches.close()
         event.accept()
 
     def logout(self):
-        self.close()  # Закрываем текущее окно
+        # Окно только прячется: после повторного входа меняются роль и видимость
+        # кнопок, а дерево виджетов, каталог и пул соединений остаются
+        self.service.logout(self.session.token if self.session else None)
+        self.hide()
         auth_dialog = AuthDialog()
-        
+
         if auth_dialog.exec_() == QDialog.Accepted:
-            user_role = auth_dialog.user_role  # Получаем новую роль после входа
-            self.__init__(user_role, self.username)  # Перезапускаем окно с новой ролью
+            self.switchUser(auth_dialog.user_role, auth_dialog.username, auth_dialog.session)
             self.show()
-            
+        else:
+            self.close()
+
+    def switchUser(self, user_role, username, session=None):
+        self.user_role = user_role
+        self.username = username
+        self.session = session
+        self.updateUI()
+
     def searchBooks(self):
         search_query = self.searchInput.text()
-        self.loadBooks(search_query)
+        if search_query:
+            self.search.submit(search_query)
+        else:
+            self.loadBooks()  # Пустой запрос обслуживается из кэша
     
     def updateUI(self):
         is_admin = self.user_role == "admin"
@@ -300,7 +485,15 @@ class LibraryApp(QWidget):
         self.statusComboBox.setVisible(is_admin)
         self.addButton.setVisible(is_admin)
         self.deleteButton.setVisible(is_admin)
+        self.pasteButton.setVisible(is_admin)
+        self.markBorrowedButton.setVisible(is_admin)
+        self.markAvailableButton.setVisible(is_admin)
+        self.overdueLabel.setVisible(is_admin)
         self.historyButton.setVisible(is_admin)
+        self.importButton.setVisible(is_admin)
+        self.reportsButton.setVisible(is_admin)
+        self.diagnosticsButton.setVisible(is_admin)
+        self.branchesButton.setVisible(self.branches is not None)
         
         self.setStyleSheet("""
         QWidget {
@@ -319,9 +512,12 @@ class LibraryApp(QWidget):
         # }
 
 class AuthDialog(QDialog):
-    def __init__(self):
+    def __init__(self, prefetch=None):
         super().__init__()
         self.username = ""  # Объявляем атрибут
+        self.session = None
+        self.prefetch = prefetch  # фоновая подготовка базы, запущенная при старте
+        self.service = LibraryService()
         self.setWindowTitle("Авторизация")
         self.setGeometry(200, 200, 300, 200)
         
@@ -348,18 +544,26 @@ class AuthDialog(QDialog):
         
         self.setLayout(layout)
         
+    def waitForSchema(self):
+        # Обычно схема готова раньше, чем пользователь введёт пароль
+        if self.prefetch is not None:
+            self.prefetch.schemaReady.wait()
+
     def authenticate(self):
         username = self.usernameInput.text()
         password = self.passwordInput.text()
+        self.waitForSchema()
 
-        conn = sqlite3.connect("library.db")
-        cursor = conn.cursor()
-        cursor.execute("SELECT role FROM users WHERE username = ? AND password = ?", (username, password))
-        result = cursor.fetchone()
-        conn.close()
+        try:
+            session = self.service.login(username, password)
+        except LoginThrottled as e:
+            QMessageBox.warning(self, "Ошибка", str(e))
+            return
 
-        if result:
-            self.user_role = result[0]
+        if session:
+            self.username = username
+            self.user_role = session.role
+            self.session = session
             self.accept()
         else:
             QMessageBox.warning(self, "Ошибка", "Неверные данные!")
@@ -371,187 +575,45 @@ class AuthDialog(QDialog):
         if not username or not password:
             QMessageBox.warning(self, "Ошибка", "Заполните все поля!")
             return
+        self.waitForSchema()
 
-        conn = sqlite3.connect("library.db")
-        cursor = conn.cursor()
-
-        try:
-            cursor.execute("INSERT INTO users (username, password, role) VALUES (?, ?, 'guest')", (username, password))
-            conn.commit()
+        if self.service.register(username, password):
             QMessageBox.information(self, "Успешно", "Аккаунт создан!")
-        except sqlite3.IntegrityError:
+        else:
             QMessageBox.warning(self, "Ошибка", "Имя пользователя уже занято!")
 
-        conn.close()
-
-class HistoryWindow(QDialog):
-    def __init__(self):
-        super().__init__()
-        self.setWindowTitle("История взятых книг")
-        self.setGeometry(400, 200, 500, 400)
-
-        layout = QVBoxLayout()
-        self.table = QTableWidget()
-        self.table.setColumnCount(3)
-        self.table.setHorizontalHeaderLabels(["Пользователь", "Книга", "Дата"])
-        layout.addWidget(self.table)
-
-        self.setLayout(layout)
-        self.load_history()
-
-    def load_history(self):
-        conn = sqlite3.connect("library.db")
-        cursor = conn.cursor()
-
-        cursor.execute("SELECT username, book_title, date_taken FROM history ORDER BY date_taken DESC")
-        records = cursor.fetchall()
-
-        self.table.setRowCount(len(records))
-
-        for row, record in enumerate(records):
-            for col, value in enumerate(record):
-                self.table.setItem(row, col, QTableWidgetItem(str(value)))
-
-        conn.close()
-    
-class HistoryWindow(QDialog):
-    def __init__(self):
-        super().__init__()
-        self.setWindowTitle("История взятых книг")
-        self.setGeometry(400, 200, 800, 500)
-
-        self.page = 0
-        self.page_size = 20
-
-        layout = QVBoxLayout()
-        
-        # Поиск и фильтрация
-        search_layout = QHBoxLayout()
-        self.search_input = QLineEdit()
-        self.search_input.setPlaceholderText("Поиск по пользователю или книге")
-        self.search_input.textChanged.connect(self.load_history)
-        
-        self.filter_combo = QComboBox()
-        self.filter_combo.addItems(["Все", "Не возвращена", "Возвращена"])
-        self.filter_combo.currentIndexChanged.connect(self.load_history)
-        
-        search_layout.addWidget(self.search_input)
-        search_layout.addWidget(self.filter_combo)
-        layout.addLayout(search_layout)
-
-        # Таблица
-        self.table = QTableWidget()
-        self.table.setColumnCount(4)
-        self.table.setHorizontalHeaderLabels(["Пользователь", "Книга", "Дата взятия", "Дата возврата"])
-        layout.addWidget(self.table)
-
-        # Кнопки
-        button_layout = QHBoxLayout()
-        self.delete_button = QPushButton("Удалить запись")
-        self.delete_button.clicked.connect(self.delete_record)
-        button_layout.addWidget(self.delete_button)
-
-        self.export_button = QPushButton("Экспорт в CSV")
-        self.export_button.clicked.connect(self.export_to_csv)
-        button_layout.addWidget(self.export_button)
-
-        self.prev_button = QPushButton("Предыдущая страница")
-        self.prev_button.clicked.connect(self.prev_page)
-        button_layout.addWidget(self.prev_button)
-
-        self.next_button = QPushButton("Следующая страница")
-        self.next_button.clicked.connect(self.next_page)
-        button_layout.addWidget(self.next_button)
-
-        layout.addLayout(button_layout)
-        self.setLayout(layout)
-
-        self.load_history()
-
-    def load_history(self):
-        conn = sqlite3.connect("library.db")
-        cursor = conn.cursor()
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Библиотека")
+    parser.add_argument("--db", default=db.DB_PATH, help="путь к файлу базы")
+    parser.add_argument("--branch", action="append", type=parse_branch, default=branches_from_env(),
+                        metavar="ИМЯ=ПУТЬ", help="база филиала для общего поиска (можно несколько раз)")
+    # Остальные аргументы достаются Qt
+    return parser.parse_known_args(argv[1:])
 
-        search_query = self.search_input.text()
-        filter_status = self.filter_combo.currentText()
-
-        query = "SELECT username, book_title, date_taken, COALESCE(date_returned, 'Не возвращена') FROM history"
-        conditions = []
-        params = []
-
-        if search_query:
-            conditions.append("(username LIKE ? OR book_title LIKE ?)")
-            params.extend([f"%{search_query}%", f"%{search_query}%"])
-        
-        if filter_status == "Не возвращена":
-            conditions.append("date_returned IS NULL")
-        elif filter_status == "Возвращена":
-            conditions.append("date_returned IS NOT NULL")
-        
-        if conditions:
-            query += " WHERE " + " AND ".join(conditions)
-        
-        query += " ORDER BY date_taken DESC LIMIT ? OFFSET ?"
-        params.extend([self.page_size, self.page * self.page_size])
-
-        cursor.execute(query, params)
-        records = cursor.fetchall()
-
-        self.table.setRowCount(len(records))
-        for row, record in enumerate(records):
-            for col, value in enumerate(record):
-                item = QTableWidgetItem(str(value))
-                if record[3] == "Не возвращена":
-                    item.setBackground(QColor(255, 200, 200))  # Красный фон для невозвращенных книг
-                self.table.setItem(row, col, item)
-
-        conn.close()
-
-    def delete_record(self):
-        selected_row = self.table.currentRow()
-        if selected_row == -1:
-            QMessageBox.warning(self, 'Ошибка', 'Выберите запись для удаления.')
-            return
-
-        username = self.table.item(selected_row, 0).text()
-        book_title = self.table.item(selected_row, 1).text()
-        reply = QMessageBox.question(self, 'Подтверждение', f'Удалить запись о книге "{book_title}" пользователя {username}?', QMessageBox.Yes | QMessageBox.No)
-        
-        if reply == QMessageBox.Yes:
-            conn = sqlite3.connect("library.db")
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM history WHERE username = ? AND book_title = ?", (username, book_title))
-            conn.commit()
-            conn.close()
-            self.load_history()
-
-    def export_to_csv(self):
-        with open('book_history.csv', mode='w', newline='', encoding='utf-8') as file:
-            writer = csv.writer(file)
-            writer.writerow(["Пользователь", "Книга", "Дата взятия", "Дата возврата"])
-            for row in range(self.table.rowCount()):
-                writer.writerow([self.table.item(row, col).text() for col in range(4)])
-        QMessageBox.information(self, "Успех", "История успешно экспортирована в CSV!")
-
-    def next_page(self):
-        self.page += 1
-        self.load_history()
-
-    def prev_page(self):
-        if self.page > 0:
-            self.page -= 1
-            self.load_history()
-        
 
 def main():
-    app = QApplication(sys.argv)
-    auth_dialog = AuthDialog()
-
-    if auth_dialog.exec_() == QDialog.Accepted:
+    metrics.mark_startup("imports", STARTED)
+    args, qt_args = parse_args(sys.argv)
+    db.configure(args.db)
+    branches = FederatedCatalog(args.branch) if args.branch else None
+    app = QApplication(sys.argv[:1] + qt_args)
+    # Окно входа показывается сразу, а схема и каталог готовятся в фоне
+    prefetch = CatalogPrefetch()
+    prefetch.finished.connect(lambda: metrics.mark_startup("prefetch", STARTED))
+    prefetch.start()
+    auth_dialog = AuthDialog(prefetch)
+    QTimer.singleShot(0, lambda: metrics.mark_startup("auth_dialog", STARTED))
+
+    accepted = auth_dialog.exec_() == QDialog.Accepted
+    prefetch.wait()
+    if accepted:
+        metrics.mark_startup("login", STARTED)
         user_role = auth_dialog.user_role  # Получаем роль после входа
         username = auth_dialog.username  # Получаем имя пользователя
-        window = LibraryApp(user_role, username)
+        window = LibraryApp(user_role, username, auth_dialog.session,
+                            prefetch if prefetch.error is None else None, branches)
         window.show()
+        QTimer.singleShot(0, lambda: (metrics.mark_startup("main_window", STARTED), metrics.log_startup()))
         sys.exit(app.exec_())
 
 if __name__ == '__main__':
@@ -0,0 +1,161 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter, deque
+
+# Замеры горячих путей. Выключены по умолчанию: тогда timed() возвращает
+# пустой объект, а трассировка SQLite не устанавливается
+enabled = os.environ.get("LIBRARY_METRICS") == "1"
+
+SAMPLES = 1000  # сколько последних замеров хранить на операцию
+SLOW_QUERY_MS = 50  # для запросов медленнее этого сохраняется план
+LOG_PATH = "metrics.log"
+LOG_MAX_BYTES = 1_000_000
+LOG_BACKUPS = 3
+
+latencies = {}
+slow_queries = deque(maxlen=50)
+trigger_counts = Counter()
+startup = {}  # этап запуска -> мс от старта процесса
+_lock = threading.Lock()
+
+logger = logging.getLogger("library.metrics")
+logger.propagate = False
+
+
+def enable(flag=True):
+    global enabled
+    enabled = flag
+    if flag and not logger.handlers:
+        from logging.handlers import RotatingFileHandler  # нужен только при включённых замерах
+        handler = RotatingFileHandler(LOG_PATH, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+
+
+def record(name, ms):
+    with _lock:
+        samples = latencies.get(name)
+        if samples is None:
+            samples = latencies[name] = deque(maxlen=SAMPLES)
+        samples.append(ms)
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _Timer:
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, (time.perf_counter() - self.start) * 1000)
+        return False
+
+
+NULL_TIMER = _NullTimer()
+
+
+def timed(name):
+    return _Timer(name) if enabled else NULL_TIMER
+
+
+# SQLite
+
+def trace(statement):
+    # Трассировка показывает и выражения внутри триггеров, которых не видно снаружи,
+    # и вызывается из потока каждого соединения, поэтому счётчики под общей блокировкой
+    if statement.startswith("-- TRIGGER "):
+        name = statement[11:].strip()
+        with _lock:
+            trigger_counts[name] += 1
+
+
+def top_triggers(limit=5):
+    with _lock:
+        return trigger_counts.most_common(limit)
+
+
+def explain(conn, sql, params):
+    if not sql.lstrip().upper().startswith(("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")):
+        return []
+    try:
+        # Базовый execute, чтобы сам EXPLAIN не попадал в замеры
+        rows = sqlite3.Connection.execute(conn, "EXPLAIN QUERY PLAN " + sql, params).fetchall()
+    except sqlite3.Error:
+        return []
+    return [row[3] for row in rows]
+
+
+def record_query(conn, sql, params, seconds):
+    ms = seconds * 1000
+    record("sql", ms)
+    if ms < SLOW_QUERY_MS:
+        return
+    entry = {"slow_query_ms": round(ms, 2), "sql": " ".join(sql.split()), "plan": explain(conn, sql, params)}
+    slow_queries.append(entry)
+    logger.warning(json.dumps(entry, ensure_ascii=False))
+
+
+def record_stall(ms):
+    record("gui_stall", ms)
+    logger.warning(json.dumps({"gui_stall_ms": round(ms, 2)}))
+
+
+def mark_startup(phase, started):
+    startup[phase] = (time.perf_counter() - started) * 1000
+
+
+def log_startup():
+    if enabled:
+        logger.info(json.dumps({"startup_ms": {phase: round(ms, 1) for phase, ms in startup.items()}}))
+
+
+# Отчёты
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def snapshot():
+    with _lock:
+        samples = {name: sorted(values) for name, values in latencies.items()}
+    return {
+        name: {
+            "count": len(values),
+            "p50": percentile(values, 0.50),
+            "p95": percentile(values, 0.95),
+            "p99": percentile(values, 0.99),
+            "max": values[-1],
+        }
+        for name, values in samples.items() if values
+    }
+
+
+def log_snapshot():
+    if enabled:
+        logger.info(json.dumps({"snapshot": snapshot()}, ensure_ascii=False))
+
+
+def reset():
+    with _lock:
+        latencies.clear()
+        trigger_counts.clear()
+    slow_queries.clear()
+
+
+if enabled:
+    enable()
@@ -0,0 +1,286 @@
+# Миграции схемы. Номер применённой миграции хранится в PRAGMA user_version,
+# поэтому каждая выполняется ровно один раз. Новые добавляются в конец списка.
+# Схема записана здесь буквально и после выпуска не меняется: база, обновлённая
+# позже, должна получить ту же схему, что и при выходе миграции
+
+
+def link_history(conn):
+    # История ссылается на книги и пользователей по id, а не по названию и имени
+    conn.execute("ALTER TABLE history ADD COLUMN book_id INTEGER REFERENCES books(id) ON DELETE SET NULL")
+    conn.execute("ALTER TABLE history ADD COLUMN user_id INTEGER REFERENCES users(id) ON DELETE SET NULL")
+
+    # Для невозвращённых книг при одинаковых названиях предпочитаем занятый экземпляр
+    conn.execute("""
+        UPDATE history SET book_id = (
+            SELECT id FROM books WHERE title = history.book_title AND status = 'Занята' ORDER BY id LIMIT 1
+        ) WHERE date_returned IS NULL
+    """)
+    conn.execute("""
+        UPDATE history SET book_id = (
+            SELECT id FROM books WHERE title = history.book_title ORDER BY id LIMIT 1
+        ) WHERE book_id IS NULL
+    """)
+    conn.execute("UPDATE history SET user_id = (SELECT users.id FROM users WHERE users.username = history.username)")
+
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_books_status ON books(status, title, author)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_books_title ON books(title, author, status)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_history_book_open ON history(book_id, username) WHERE date_returned IS NULL")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_history_user_open ON history(user_id, book_id) WHERE date_returned IS NULL")
+
+    # Записи, вставленные без ссылок (импорт, другие клиенты), связываются по тому же
+    # правилу. Без book_id выдачу нельзя закрыть: возврат ищет её по книге
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS history_link_ai AFTER INSERT ON history BEGIN
+            UPDATE history SET book_id = (
+                SELECT id FROM books WHERE title = new.book_title
+                ORDER BY new.date_returned IS NULL AND status = 'Занята' DESC, id LIMIT 1
+            ) WHERE id = new.id AND new.book_id IS NULL AND EXISTS (SELECT 1 FROM books WHERE title = new.book_title);
+            UPDATE history SET user_id = (SELECT id FROM users WHERE username = new.username)
+            WHERE id = new.id AND new.user_id IS NULL AND EXISTS (SELECT 1 FROM users WHERE username = new.username);
+        END
+    """)
+
+
+def index_foreign_keys(conn):
+    # Без полного индекса по дочернему ключу каждая вставка и удаление книги
+    # или пользователя просматривают всю историю ради проверки внешних ключей
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_history_book_id ON history(book_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_history_user_id ON history(user_id)")
+
+
+def circulation_stats(conn):
+    # Агрегаты для отчётов (см. analytics). checkouts и open_loans в stats_daily —
+    # по дню выдачи, returns — по дню возврата
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS stats_books (
+        book_id INTEGER PRIMARY KEY,
+        title TEXT NOT NULL,
+        loans INTEGER NOT NULL DEFAULT 0,
+        open_loans INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS stats_users (
+        username TEXT PRIMARY KEY,
+        loans INTEGER NOT NULL DEFAULT 0,
+        open_loans INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS stats_daily (
+        day TEXT PRIMARY KEY,
+        checkouts INTEGER NOT NULL DEFAULT 0,
+        returns INTEGER NOT NULL DEFAULT 0,
+        open_loans INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    # Пока здесь есть строка, удаление из history не вычитается из агрегатов.
+    # Строку видит только транзакция архивации (analytics.kept)
+    conn.execute("CREATE TABLE IF NOT EXISTS stats_keep (active INTEGER)")
+    # Идущий пересчёт (analytics.rebuild): строки history с id в (done, high_water]
+    # он учтёт сам, в их текущем виде, поэтому триггеры их пропускают
+    conn.execute("CREATE TABLE IF NOT EXISTS stats_rebuild (high_water INTEGER NOT NULL, done INTEGER NOT NULL)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_stats_books_loans ON stats_books(loans)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_stats_users_open ON stats_users(open_loans)")
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS history_stats_ai AFTER INSERT ON history
+        WHEN NOT EXISTS (SELECT 1 FROM stats_rebuild WHERE new.id > done AND new.id <= high_water) BEGIN
+            INSERT INTO stats_books (book_id, title, loans, open_loans)
+            SELECT new.book_id, new.book_title, 1, (new.date_returned IS NULL) WHERE new.book_id IS NOT NULL
+            ON CONFLICT(book_id) DO UPDATE SET loans = loans + excluded.loans, open_loans = open_loans + excluded.open_loans;
+            INSERT INTO stats_users (username, loans, open_loans) VALUES (new.username, 1, (new.date_returned IS NULL))
+            ON CONFLICT(username) DO UPDATE SET loans = loans + excluded.loans, open_loans = open_loans + excluded.open_loans;
+            INSERT INTO stats_daily (day, checkouts, open_loans) VALUES (date(new.date_taken), 1, (new.date_returned IS NULL))
+            ON CONFLICT(day) DO UPDATE SET checkouts = checkouts + excluded.checkouts, open_loans = open_loans + excluded.open_loans;
+            INSERT INTO stats_daily (day, returns)
+            SELECT date(new.date_returned), 1 WHERE new.date_returned IS NOT NULL
+            ON CONFLICT(day) DO UPDATE SET returns = returns + excluded.returns;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS history_stats_ad AFTER DELETE ON history
+        WHEN NOT EXISTS (SELECT 1 FROM stats_keep)
+         AND NOT EXISTS (SELECT 1 FROM stats_rebuild WHERE old.id > done AND old.id <= high_water) BEGIN
+            INSERT INTO stats_books (book_id, title, loans, open_loans)
+            SELECT old.book_id, old.book_title, -1, -(old.date_returned IS NULL) WHERE old.book_id IS NOT NULL
+            ON CONFLICT(book_id) DO UPDATE SET loans = loans + excluded.loans, open_loans = open_loans + excluded.open_loans;
+            INSERT INTO stats_users (username, loans, open_loans) VALUES (old.username, -1, -(old.date_returned IS NULL))
+            ON CONFLICT(username) DO UPDATE SET loans = loans + excluded.loans, open_loans = open_loans + excluded.open_loans;
+            INSERT INTO stats_daily (day, checkouts, open_loans) VALUES (date(old.date_taken), -1, -(old.date_returned IS NULL))
+            ON CONFLICT(day) DO UPDATE SET checkouts = checkouts + excluded.checkouts, open_loans = open_loans + excluded.open_loans;
+            INSERT INTO stats_daily (day, returns)
+            SELECT date(old.date_returned), -1 WHERE old.date_returned IS NOT NULL
+            ON CONFLICT(day) DO UPDATE SET returns = returns + excluded.returns;
+        END
+    """)
+    # Срабатывает и при ON DELETE SET NULL, когда удаляется книга
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS history_stats_au
+        AFTER UPDATE OF username, book_id, book_title, date_taken, date_returned ON history
+        WHEN NOT EXISTS (SELECT 1 FROM stats_rebuild WHERE old.id > done AND old.id <= high_water) BEGIN
+            INSERT INTO stats_books (book_id, title, loans, open_loans)
+            SELECT old.book_id, old.book_title, -1, -(old.date_returned IS NULL) WHERE old.book_id IS NOT NULL
+            ON CONFLICT(book_id) DO UPDATE SET loans = loans + excluded.loans, open_loans = open_loans + excluded.open_loans;
+            INSERT INTO stats_users (username, loans, open_loans) VALUES (old.username, -1, -(old.date_returned IS NULL))
+            ON CONFLICT(username) DO UPDATE SET loans = loans + excluded.loans, open_loans = open_loans + excluded.open_loans;
+            INSERT INTO stats_daily (day, checkouts, open_loans) VALUES (date(old.date_taken), -1, -(old.date_returned IS NULL))
+            ON CONFLICT(day) DO UPDATE SET checkouts = checkouts + excluded.checkouts, open_loans = open_loans + excluded.open_loans;
+            INSERT INTO stats_daily (day, returns)
+            SELECT date(old.date_returned), -1 WHERE old.date_returned IS NOT NULL
+            ON CONFLICT(day) DO UPDATE SET returns = returns + excluded.returns;
+            INSERT INTO stats_books (book_id, title, loans, open_loans)
+            SELECT new.book_id, new.book_title, 1, (new.date_returned IS NULL) WHERE new.book_id IS NOT NULL
+            ON CONFLICT(book_id) DO UPDATE SET loans = loans + excluded.loans, open_loans = open_loans + excluded.open_loans;
+            INSERT INTO stats_users (username, loans, open_loans) VALUES (new.username, 1, (new.date_returned IS NULL))
+            ON CONFLICT(username) DO UPDATE SET loans = loans + excluded.loans, open_loans = open_loans + excluded.open_loans;
+            INSERT INTO stats_daily (day, checkouts, open_loans) VALUES (date(new.date_taken), 1, (new.date_returned IS NULL))
+            ON CONFLICT(day) DO UPDATE SET checkouts = checkouts + excluded.checkouts, open_loans = open_loans + excluded.open_loans;
+            INSERT INTO stats_daily (day, returns)
+            SELECT date(new.date_returned), 1 WHERE new.date_returned IS NOT NULL
+            ON CONFLICT(day) DO UPDATE SET returns = returns + excluded.returns;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS books_stats_au AFTER UPDATE OF title ON books BEGIN
+            UPDATE stats_books SET title = new.title WHERE book_id = new.id;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS books_stats_ad AFTER DELETE ON books BEGIN
+            DELETE FROM stats_books WHERE book_id = old.id;
+        END
+    """)
+    # Существующая история учитывается один раз
+    conn.execute("""
+        INSERT INTO stats_books (book_id, title, loans, open_loans)
+        SELECT book_id, COALESCE((SELECT title FROM books WHERE id = book_id), MAX(book_title)),
+               COUNT(*), SUM(date_returned IS NULL) FROM history WHERE book_id IS NOT NULL
+        GROUP BY book_id
+    """)
+    conn.execute("""
+        INSERT INTO stats_users (username, loans, open_loans)
+        SELECT username, COUNT(*), SUM(date_returned IS NULL) FROM history GROUP BY username
+    """)
+    conn.execute("""
+        INSERT INTO stats_daily (day, checkouts, open_loans)
+        SELECT date(date_taken), COUNT(*), SUM(date_returned IS NULL) FROM history GROUP BY 1
+    """)
+    conn.execute("""
+        INSERT INTO stats_daily (day, returns)
+        SELECT date(date_returned), COUNT(*) FROM history WHERE date_returned IS NOT NULL GROUP BY 1
+        ON CONFLICT(day) DO UPDATE SET returns = returns + excluded.returns
+    """)
+
+
+def change_feed(conn):
+    # Журнал изменений для обновления открытых окон без перечитывания таблиц (см. changelog).
+    # AUTOINCREMENT: номера не переиспользуются и после чистки
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS change_log (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        tbl TEXT NOT NULL,
+        row_id INTEGER NOT NULL,
+        logged REAL NOT NULL DEFAULT 0
+        )
+    """)
+    for table in ("books", "history"):
+        for event, row in (("INSERT", "new"), ("UPDATE", "new"), ("DELETE", "old")):
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {table}_log_{event.lower()} AFTER {event} ON {table} BEGIN
+                    INSERT INTO change_log (tbl, row_id, logged) VALUES ('{table}', {row}.id, julianday('now'));
+                END
+            """)
+    # Журнал ограничен без отдельного процесса: каждая тысячная запись удаляет всё,
+    # что старше 10000 последних и записано больше минуты назад. Без второго условия
+    # окна, не успевшие дочитать крупную пакетную операцию, теряли бы записи
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS change_log_compact AFTER INSERT ON change_log
+        WHEN new.seq % 1000 = 0 BEGIN
+            DELETE FROM change_log WHERE seq <= new.seq - 10000 AND logged < julianday('now', '-60 seconds');
+        END
+    """)
+
+
+def trigram_index(conn):
+    # Индекс триграмм для нечёткого поиска книг (см. fuzzy). Ключ (book_id, trigram):
+    # удаление и размер книги читаются по префиксу, а поиск кандидатов идёт по индексу trigram.
+    # Триграммы считаются в Python: триггеры только ставят книги в очередь
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS book_trigrams (
+        book_id INTEGER NOT NULL,
+        trigram TEXT NOT NULL,
+        PRIMARY KEY (book_id, trigram)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_book_trigrams ON book_trigrams(trigram)")
+    conn.execute("CREATE TABLE IF NOT EXISTS book_trigrams_pending (book_id INTEGER PRIMARY KEY)")
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS books_trigrams_ai AFTER INSERT ON books BEGIN
+            INSERT OR IGNORE INTO book_trigrams_pending (book_id) VALUES (new.id);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS books_trigrams_ad AFTER DELETE ON books BEGIN
+            DELETE FROM book_trigrams WHERE book_id = old.id;
+            DELETE FROM book_trigrams_pending WHERE book_id = old.id;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS books_trigrams_au AFTER UPDATE OF title, author ON books BEGIN
+            DELETE FROM book_trigrams WHERE book_id = old.id;
+            INSERT OR IGNORE INTO book_trigrams_pending (book_id) VALUES (new.id);
+        END
+    """)
+    # Существующий каталог проиндексирует первая запись или нечёткий поиск
+    conn.execute("INSERT OR IGNORE INTO book_trigrams_pending (book_id) SELECT id FROM books")
+
+
+def loan_schedule(conn):
+    # Сроки возврата (14 дней) и очередь бронирования (см. loans)
+    conn.execute("ALTER TABLE history ADD COLUMN due_date TEXT")
+    # Для уже открытых выдач срок отсчитывается от даты выдачи
+    conn.execute("UPDATE history SET due_date = datetime(date_taken, '+14 days') WHERE date_returned IS NULL")
+    # Выдачи, записанные в обход checkout.borrow: импорт, генератор нагрузочных
+    # тестов, другие клиенты базы
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS history_due_ai AFTER INSERT ON history
+        WHEN new.due_date IS NULL BEGIN
+            UPDATE history SET due_date = datetime(new.date_taken, '+14 days') WHERE id = new.id;
+        END
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_history_due ON history(due_date) WHERE date_returned IS NULL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS reservations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        book_id INTEGER NOT NULL REFERENCES books(id) ON DELETE CASCADE,
+        user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+        username TEXT NOT NULL,
+        created TEXT NOT NULL,
+        UNIQUE (book_id, username)
+        )
+    """)
+    # Голова очереди книги — первая запись по (book_id, id)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_reservations_queue ON reservations(book_id, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_reservations_user ON reservations(user_id)")
+
+
+MIGRATIONS = [
+    link_history,
+    index_foreign_keys,
+    circulation_stats,
+    change_feed,
+    trigram_index,
+    loan_schedule,
+]
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    version = schema_version(conn)
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        migration(conn)
+        conn.execute(f"PRAGMA user_version = {number}")
+    return len(MIGRATIONS)
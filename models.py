@@ -0,0 +1,299 @@
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QSortFilterProxyModel, QThread, pyqtSignal
+from PyQt5.QtGui import QColor
+
+import db
+import metrics
+from service import LibraryService, NOT_RETURNED
+from store import BookStore
+
+
+class BookTableModel(QAbstractTableModel):
+    HEADERS = ['Название', 'Автор', 'Статус']
+    FETCH_BATCH = 200  # столько строк отдаётся представлению за один fetchMore
+    RESET_RANGES = 50  # при большем числе разрозненных удалений модель сбрасывается целиком
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.store = BookStore()
+        self.visible = 0
+
+    def setBooks(self, store):
+        self.beginResetModel()
+        self.store = store
+        self.visible = min(len(store), self.FETCH_BATCH)
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.visible
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and index.isValid():
+            return self.store.value(index.row(), index.column())
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.visible < len(self.store)
+
+    def fetchMore(self, parent=QModelIndex()):
+        count = min(self.FETCH_BATCH, len(self.store) - self.visible)
+        if count <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self.visible, self.visible + count - 1)
+        self.visible += count
+        self.endInsertRows()
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        # Сортируется всё хранилище, а не только уже показанные строки
+        self.layoutAboutToBeChanged.emit()
+        self.store.sort(column, order == Qt.DescendingOrder)
+        self.layoutChanged.emit()
+
+    def bookAt(self, row):
+        return self.store.book(row)
+
+    # Точечные изменения без перезагрузки всей таблицы
+
+    def insertBooks(self, books):
+        # Книги, уже пришедшие из журнала изменений, второй раз не добавляются
+        books = [book for book in books if self.store.find(book[0]) is None]
+        if not books:
+            return
+        first = len(self.store)
+        if self.visible < first:
+            # Строки появятся при следующих fetchMore
+            self.store.extend(books)
+            return
+        self.beginInsertRows(QModelIndex(), first, first + len(books) - 1)
+        self.store.extend(books)
+        self.visible += len(books)
+        self.endInsertRows()
+
+    def removeBooks(self, book_ids):
+        rows = {row for row in map(self.store.find, book_ids) if row is not None}
+        shown = sorted(row for row in rows if row < self.visible)
+        # Подряд идущие видимые строки удаляются одним диапазоном
+        ranges = []
+        for row in shown:
+            if ranges and ranges[-1][1] == row - 1:
+                ranges[-1][1] = row
+            else:
+                ranges.append([row, row])
+        if len(ranges) > self.RESET_RANGES:
+            self.beginResetModel()
+            self.store.removeRows(rows)
+            self.visible -= len(shown)
+            self.endResetModel()
+            return
+        if len(rows) > len(shown):
+            self.store.removeRows(rows.difference(shown))  # скрытые строки идут после видимых
+        for first, last in reversed(ranges):
+            self.beginRemoveRows(QModelIndex(), first, last)
+            self.store.removeRange(first, last)
+            self.visible -= last - first + 1
+            self.endRemoveRows()
+
+    def setBookStatuses(self, changes):
+        # changes — пары (id, статус); представление получает один dataChanged
+        rows = []
+        for book_id, status in changes:
+            row = self.store.find(book_id)
+            if row is not None:
+                self.store.setStatus(row, status)
+                rows.append(row)
+        shown = [row for row in rows if row < self.visible]
+        if shown:
+            self.dataChanged.emit(self.index(min(shown), 2), self.index(max(shown), 2), [Qt.DisplayRole])
+
+
+class BookFilterProxyModel(QSortFilterProxyModel):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.status_filter = None
+
+    def setStatusFilter(self, status):
+        self.status_filter = status
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        if self.status_filter is None:
+            return True
+        return self.sourceModel().store.status(source_row) == self.status_filter
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        # Сортировку выполняет исходная модель целиком
+        self.sourceModel().sort(column, order)
+
+    def bookAt(self, row):
+        source_row = self.mapToSource(self.index(row, 0)).row()
+        return self.sourceModel().bookAt(source_row)
+
+
+class HistoryWorker(QThread):
+    pageLoaded = pyqtSignal(int, list)
+
+    def __init__(self, generation, load, *args):
+        super().__init__()
+        self.generation = generation
+        self.load = load  # метод LibraryService: history_page или search_archive
+        self.args = args
+
+    def run(self):
+        self.pageLoaded.emit(self.generation, self.load(LibraryService(), *self.args))
+
+
+class HistoryTableModel(QAbstractTableModel):
+    HEADERS = ["Пользователь", "Книга", "Дата взятия", "Дата возврата", "Срок возврата"]
+    PAGE_SIZE = 100
+    NOT_RETURNED_COLOR = QColor(255, 200, 200)  # Красный фон для невозвращенных книг
+    OVERDUE_COLOR = QColor(255, 120, 120)  # Просроченные — ярче; признак приходит из запроса
+    ARCHIVED_COLOR = QColor(230, 230, 230)  # Серый фон для записей из архива
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.records = []
+        self.search = ""
+        self.status_filter = "Все"
+        self.include_archive = False
+        self.archive_start = None  # с этой строки идут записи из архива
+        self.generation = 0
+        self.exhausted = False
+        self.loading = False
+        self.workers = []
+
+    def setQuery(self, search, status_filter, include_archive=False):
+        # Новый запрос: старые незавершённые страницы будут отброшены по поколению
+        self.beginResetModel()
+        self.records = []
+        self.search = search
+        self.status_filter = status_filter
+        # В архиве только возвращённые книги; он читается после всех страниц history
+        self.include_archive = include_archive and status_filter != "Не возвращена"
+        self.archive_start = None
+        self.generation += 1
+        self.exhausted = False
+        self.loading = False
+        self.endResetModel()
+        self.fetchMore()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.records)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        record = self.records[index.row()]
+        if role == Qt.DisplayRole:
+            return record[index.column() + 1]
+        if role == Qt.BackgroundRole and record[6]:
+            return self.OVERDUE_COLOR
+        if role == Qt.BackgroundRole and record[4] == NOT_RETURNED:
+            return self.NOT_RETURNED_COLOR
+        if role == Qt.BackgroundRole and self.isArchived(index.row()):
+            return self.ARCHIVED_COLOR
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self.exhausted and not self.loading
+
+    def fetchMore(self, parent=QModelIndex()):
+        if self.exhausted or self.loading:
+            return
+        self.loading = True
+        if self.archive_start is not None:
+            worker = HistoryWorker(self.generation, LibraryService.search_archive, self.search)
+        else:
+            after = (self.records[-1][3], self.records[-1][0]) if self.records else None
+            worker = HistoryWorker(self.generation, LibraryService.history_page,
+                                   self.search, self.status_filter, after, self.PAGE_SIZE)
+        worker.pageLoaded.connect(self.appendPage)
+        worker.finished.connect(lambda: self.workers.remove(worker))
+        self.workers.append(worker)
+        worker.start()
+
+    def appendPage(self, generation, records):
+        if generation != self.generation:
+            return
+        self.loading = False
+        if self.archive_start is not None:
+            self.exhausted = True  # Архив приходит одной выборкой
+        elif len(records) < self.PAGE_SIZE and self.include_archive:
+            self.archive_start = len(self.records) + len(records)
+        else:
+            self.exhausted = len(records) < self.PAGE_SIZE
+        if records:
+            start = len(self.records)
+            with metrics.timed("history_append"):
+                self.beginInsertRows(QModelIndex(), start, start + len(records) - 1)
+                self.records.extend(records)
+                self.endInsertRows()
+
+    def recordAt(self, row):
+        return self.records[row]
+
+    def isArchived(self, row):
+        return self.archive_start is not None and row >= self.archive_start
+
+    def accepts(self, record):
+        if self.status_filter == "Не возвращена" and record[4] != NOT_RETURNED:
+            return False
+        if self.status_filter == "Возвращена" and record[4] == NOT_RETURNED:
+            return False
+        return db.matches(self.search, record[1], record[2])
+
+    def applyChanges(self, changes):
+        # Изменения из журнала: (id, актуальная запись или None, если удалена)
+        for record_id, record in changes:
+            hot = self.records if self.archive_start is None else self.records[:self.archive_start]
+            row = next((row for row, old in enumerate(hot) if old[0] == record_id), None)
+            if record is None or not self.accepts(record):
+                if row is not None:
+                    self.removeRecord(row)
+            elif row is not None:
+                self.records[row] = record
+                self.dataChanged.emit(self.index(row, 0), self.index(row, len(self.HEADERS) - 1))
+            else:
+                self.insertRecord(record)
+
+    def markOverdue(self, record_ids):
+        # Выдачи, у которых только что истёк срок (от OverdueScheduler)
+        record_ids = set(record_ids)
+        for row, record in enumerate(self.records if self.archive_start is None else self.records[:self.archive_start]):
+            if record[0] in record_ids and not record[6]:
+                self.records[row] = record[:6] + (1,)
+                self.dataChanged.emit(self.index(row, 0), self.index(row, len(self.HEADERS) - 1))
+
+    def insertRecord(self, record):
+        # Порядок тот же, что у запроса: date_taken DESC, id DESC
+        key = (record[3], record[0])
+        hot = self.records if self.archive_start is None else self.records[:self.archive_start]
+        row = next((row for row, old in enumerate(hot) if (old[3], old[0]) < key), len(hot))
+        if row == len(hot) and not self.exhausted and self.archive_start is None:
+            return  # Запись попадёт в одну из ещё не загруженных страниц
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.records.insert(row, record)
+        if self.archive_start is not None:
+            self.archive_start += 1
+        self.endInsertRows()
+
+    def removeRecord(self, row):
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self.records[row]
+        if self.archive_start is not None and row < self.archive_start:
+            self.archive_start -= 1
+        self.endRemoveRows()
@@ -0,0 +1,103 @@
+import calendar
+import heapq
+import threading
+import time
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+import db
+import loans
+from service import history_cache
+
+MAX_SLEEP = 60  # секунды; страховка от перевода системных часов
+
+
+def now():
+    return time.strftime(loans.TIME_FORMAT, time.gmtime())
+
+
+def seconds_until(moment):
+    return calendar.timegm(time.strptime(moment, loans.TIME_FORMAT)) - time.time()
+
+
+# Планировщик просрочек. Открытые выдачи с ещё не истёкшим сроком лежат в куче
+# по due_date; поток спит до ближайшего срока, а не проверяет все выдачи по таймеру.
+# Новые выдачи добавляются через schedule() (из журнала изменений), возвращённые
+# не удаляются из кучи, а отсеиваются при извлечении одним запросом по id
+class OverdueScheduler(QThread):
+    becameOverdue = pyqtSignal(list)  # (id, пользователь, книга, срок)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.path = db.pool.path
+        self.heap = []  # (due_date, id)
+        self.pending = []  # id выдач, срок которых нужно прочитать
+        self.condition = threading.Condition()
+        self.stopped = False
+
+    def schedule(self, record_ids):
+        with self.condition:
+            self.pending.extend(record_ids)
+            self.condition.notify()
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        self.wait()
+
+    def run(self):
+        conn = db.connect(self.path)
+        try:
+            # Один раз при запуске: диапазон частичного индекса idx_history_due
+            self.push(conn.execute("""
+                SELECT due_date, id FROM history WHERE date_returned IS NULL AND due_date >= datetime('now')
+            """))
+            while True:
+                pending, due = self.next_batch()
+                if pending is None:
+                    return
+                if pending:
+                    self.push(self.lookup(conn, "due_date, id", pending, "due_date >= datetime('now')"))
+                if due:
+                    expired = self.lookup(conn, "id, username, book_title, due_date", due,
+                                          "due_date < datetime('now')")
+                    if expired:
+                        # Признак просрочки в закэшированных страницах истории устарел,
+                        # хотя версия базы не менялась
+                        history_cache.clear()
+                        self.becameOverdue.emit(expired)
+        finally:
+            conn.close()
+
+    def push(self, rows):
+        with self.condition:
+            for row in rows:
+                heapq.heappush(self.heap, tuple(row))
+
+    def next_batch(self):
+        # Ждёт новых выдач или ближайшего срока; (None, None) — поток остановлен
+        with self.condition:
+            while not self.stopped:
+                due = []
+                moment = now()
+                while self.heap and self.heap[0][0] < moment:
+                    due.append(heapq.heappop(self.heap)[1])
+                if due or self.pending:
+                    pending, self.pending = self.pending, []
+                    return pending, due
+                timeout = min(seconds_until(self.heap[0][0]), MAX_SLEEP) if self.heap else MAX_SLEEP
+                self.condition.wait(max(timeout, 0) + 0.5)  # срок в базе — с точностью до секунды
+            return None, None
+
+    def lookup(self, conn, columns, record_ids, condition):
+        # Только открытые выдачи из списка; чтение по первичному ключу
+        rows = []
+        for start in range(0, len(record_ids), 500):
+            chunk = record_ids[start:start + 500]
+            placeholders = ", ".join("?" * len(chunk))
+            rows += conn.execute(f"""
+                SELECT {columns} FROM history
+                WHERE id IN ({placeholders}) AND date_returned IS NULL AND {condition}
+            """, chunk).fetchall()
+        return rows
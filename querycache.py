@@ -0,0 +1,59 @@
+import threading
+from collections import OrderedDict
+
+# Кэш результатов запросов с вытеснением давно не использованных (LRU).
+# Ключ дополняется версией базы: после любого коммита версия меняется,
+# и все сохранённые результаты сбрасываются разом
+
+CACHE_ENTRIES = 64  # сколько разных запросов помнить
+CACHE_ROWS = 20000  # и сколько строк во всех результатах вместе
+
+
+class QueryCache:
+    def __init__(self, max_entries=CACHE_ENTRIES, max_rows=CACHE_ROWS):
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self.entries = OrderedDict()
+        self.rows = 0
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, version):
+        with self.lock:
+            if version != self.version:
+                self._clear(version)
+            rows = self.entries.get(key)
+            if rows is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+        return list(rows)  # копия: вызывающий может дополнять список
+
+    def put(self, key, version, rows):
+        rows = tuple(rows)
+        if len(rows) > self.max_rows:
+            return
+        with self.lock:
+            if version != self.version:
+                # База изменилась, пока выполнялся запрос: результат мог устареть
+                return
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.rows -= len(old)
+            self.entries[key] = rows
+            self.rows += len(rows)
+            while len(self.entries) > self.max_entries or self.rows > self.max_rows:
+                _, evicted = self.entries.popitem(last=False)
+                self.rows -= len(evicted)
+
+    def clear(self):
+        with self.lock:
+            self._clear(None)
+
+    def _clear(self, version):
+        self.entries.clear()
+        self.rows = 0
+        self.version = version
@@ -0,0 +1,97 @@
+import sqlite3
+
+from PyQt5.QtCore import Qt, QThread, pyqtSignal
+from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QTableWidget, QTableWidgetItem,
+                             QHeaderView, QPushButton, QLabel, QTabWidget, QProgressDialog, QMessageBox)
+
+from service import LibraryService
+
+TOP_LIMIT = 20
+DAYS = 30
+
+
+class RebuildWorker(QThread):
+    progressed = pyqtSignal(int, int)
+
+    def __init__(self, service):
+        super().__init__()
+        self.service = service
+        self.error = None
+
+    def run(self):
+        try:
+            self.service.rebuild_analytics(progress=self.progressed.emit)
+        except sqlite3.Error as e:
+            self.error = str(e)
+
+
+def make_table(columns):
+    table = QTableWidget()
+    table.setColumnCount(len(columns))
+    table.setHorizontalHeaderLabels(columns)
+    table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+    table.setEditTriggers(QTableWidget.NoEditTriggers)
+    return table
+
+
+def fill_table(table, rows):
+    table.setRowCount(len(rows))
+    for row, values in enumerate(rows):
+        for column, value in enumerate(values):
+            table.setItem(row, column, QTableWidgetItem(str(value)))
+
+
+# Отчёты о выдачах. Данные берутся из агрегатов analytics
+class ReportsDialog(QDialog):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.service = LibraryService()
+        self.setWindowTitle("Отчёты")
+        self.setGeometry(300, 200, 700, 500)
+
+        layout = QVBoxLayout()
+
+        self.summaryLabel = QLabel()
+        layout.addWidget(self.summaryLabel)
+
+        tabs = QTabWidget()
+        self.booksTable = make_table(["Название", "Выдач", "Сейчас на руках"])
+        tabs.addTab(self.booksTable, "Популярные книги")
+        self.usersTable = make_table(["Пользователь", "На руках", "Всего выдач"])
+        tabs.addTab(self.usersTable, "Читатели")
+        self.dailyTable = make_table(["День", "Выдано", "Возвращено"])
+        tabs.addTab(self.dailyTable, f"Последние {DAYS} дней")
+        layout.addWidget(tabs)
+
+        buttons = QHBoxLayout()
+        refreshButton = QPushButton("Обновить")
+        refreshButton.clicked.connect(self.refresh)
+        buttons.addWidget(refreshButton)
+        rebuildButton = QPushButton("Пересчитать")
+        rebuildButton.clicked.connect(self.rebuild)
+        buttons.addWidget(rebuildButton)
+        layout.addLayout(buttons)
+
+        self.setLayout(layout)
+        self.refresh()
+
+    def refresh(self):
+        report = self.service.report(TOP_LIMIT, DAYS)
+        self.summaryLabel.setText(f"На руках: {report['open']}, "
+                                  f"просрочено: {report['overdue']}")
+        fill_table(self.booksTable, [row[1:] for row in report["top_books"]])
+        fill_table(self.usersTable, report["top_borrowers"])
+        fill_table(self.dailyTable, report["daily"])
+
+    def rebuild(self):
+        worker = RebuildWorker(self.service)
+        dialog = QProgressDialog("Пересчёт статистики", None, 0, 0, self)
+        dialog.setWindowModality(Qt.WindowModal)
+        worker.progressed.connect(lambda done, total: (dialog.setMaximum(total), dialog.setValue(done)))
+        worker.finished.connect(dialog.accept)
+        worker.start()
+        dialog.exec_()
+        worker.wait()
+        if worker.error:
+            QMessageBox.critical(self, "Ошибка", worker.error)
+        self.refresh()
@@ -0,0 +1,100 @@
+import sqlite3
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, QTimer, pyqtSignal
+
+import db
+from service import search_books
+
+DEBOUNCE_MS = 250  # пауза после последнего нажатия клавиши перед запросом
+PROGRESS_STEPS = 1000  # как часто SQLite проверяет отмену (в инструкциях VM)
+MAX_THREADS = 2
+
+
+class SearchSignals(QObject):
+    done = pyqtSignal(int, object)
+    failed = pyqtSignal(int, str)
+
+
+class SearchTask(QRunnable):
+    def __init__(self, pipeline, generation, text):
+        super().__init__()
+        self.pipeline = pipeline
+        self.generation = generation
+        self.text = text
+        self.fuzzy = pipeline.fuzzy
+
+    def stale(self):
+        return self.pipeline.generation != self.generation
+
+    def run(self):
+        if self.stale():
+            return
+        signals = self.pipeline.signals
+        with db.connection() as conn:
+            # Обработчик прогресса прерывает запрос, как только пришёл более новый
+            conn.set_progress_handler(self.stale, PROGRESS_STEPS)
+            try:
+                books = search_books(conn, self.text, self.fuzzy)
+            except sqlite3.OperationalError as e:
+                if not self.stale():
+                    signals.failed.emit(self.generation, str(e))
+                return
+            finally:
+                conn.set_progress_handler(None, 0)
+        signals.done.emit(self.generation, books)
+
+
+class SearchPipeline(QObject):
+    booksLoaded = pyqtSignal(object)
+    searchFailed = pyqtSignal(str)
+
+    def __init__(self, debounce_ms=DEBOUNCE_MS, parent=None):
+        super().__init__(parent)
+        self.generation = 0
+        self.pending = ""
+        self.fuzzy = False  # нечёткий поиск с учётом опечаток
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(debounce_ms)
+        self.timer.timeout.connect(self.start)
+
+        # Один пул потоков на все запросы вместо нового QThread на каждое нажатие
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(MAX_THREADS)
+
+        self.signals = SearchSignals()
+        self.signals.done.connect(self.onDone)
+        self.signals.failed.connect(self.onFailed)
+
+    def setDebounce(self, debounce_ms):
+        self.timer.setInterval(debounce_ms)
+
+    def submit(self, text, immediate=False):
+        # Новый номер поколения сразу делает выполняющийся запрос устаревшим
+        self.generation += 1
+        self.pending = text
+        if immediate:
+            self.timer.stop()
+            self.start()
+        else:
+            self.timer.start()
+
+    def cancel(self):
+        self.generation += 1
+        self.timer.stop()
+
+    def start(self):
+        self.pool.start(SearchTask(self, self.generation, self.pending))
+
+    def onDone(self, generation, books):
+        # Показываем только результат самого свежего запроса
+        if generation == self.generation:
+            self.booksLoaded.emit(books)
+
+    def onFailed(self, generation, message):
+        if generation == self.generation:
+            self.searchFailed.emit(message)
+
+    def wait(self, msecs=-1):
+        return self.pool.waitForDone(msecs)
@@ -0,0 +1,348 @@
+import sqlite3
+
+import analytics
+import archive
+import auth
+import changelog
+import db
+import fuzzy
+import loans
+import metrics
+import querycache
+from checkout import BatchResult, CheckoutEngine
+from store import BookStore, STATUS_AVAILABLE, STATUS_BORROWED
+
+# Бизнес-логика библиотеки без зависимости от PyQt:
+# её вызывают окна приложения, командная строка и нагрузочные тесты
+
+NOT_RETURNED = "Не возвращена"
+# Запись истории для окон: ..., дата возврата или NOT_RETURNED, срок, признак просрочки
+HISTORY_COLUMNS = (f"id, username, book_title, date_taken, COALESCE(date_returned, '{NOT_RETURNED}'), due_date, "
+                   "date_returned IS NULL AND due_date < datetime('now')")
+# Книг в одной транзакции пакетной операции. Крупные пачки заметно быстрее
+# (индексы поиска меняются на одних и тех же страницах). Журнал изменений
+# получает несколько записей на каждую книгу; окна дочитывают его страницами,
+# а чистка не трогает записи моложе минуты (миграция change_feed), поэтому размер пачки
+# не приводит к полной перезагрузке каталога
+BULK_CHUNK = 2000
+
+
+def search_books(conn, text, fuzzy_mode=False):
+    query = "SELECT id, title, author, status FROM books"
+    params = ()
+    match = db.fts_query(text)
+    if match and fuzzy_mode:
+        # Опечатки в запросе: кандидаты по индексу триграмм, лучшие первыми
+        with metrics.timed("fuzzy_search"):
+            if fuzzy.stale(conn):
+                # Книги, добавленные в обход приложения, ещё не проиндексированы
+                with db.transaction() as writer:
+                    fuzzy.refresh(writer)
+            return BookStore(fuzzy.search(conn, text))
+    if match:
+        # Результаты упорядочены по релевантности (bm25)
+        query = """
+            SELECT books.id, books.title, books.author, books.status
+            FROM books_fts JOIN books ON books.id = books_fts.rowid
+            WHERE books_fts MATCH ? ORDER BY books_fts.rank
+        """
+        params = (match,)
+    # Строки читаются курсором прямо в компактное хранилище
+    with metrics.timed("search"):
+        return BookStore(conn.execute(query, params))
+
+
+# Страницы истории: повторный поиск или возврат к уже виденной странице
+# не идёт в базу, пока в ней ничего не изменилось
+history_cache = querycache.QueryCache()
+
+
+def run_chunked(operation, items, chunk_size=BULK_CHUNK, progress=None, cancelled=None):
+    # Пакетная операция короткими транзакциями по chunk_size книг, чтобы не держать
+    # блокировку записи всё время. operation(chunk) возвращает BatchResult пачки.
+    # Отмена срабатывает между пачками; уже выполненные остаются в результате
+    result = BatchResult([], [])
+    for start in range(0, len(items), chunk_size):
+        if cancelled and cancelled():
+            break
+        done, failed = operation(items[start:start + chunk_size])
+        result.done.extend(done)
+        result.failed.extend(failed)
+        if progress:
+            progress(len(result.done) + len(result.failed))
+    return result
+
+
+def insert_books(conn, books):
+    # books — (название, автор, статус); в done попадают строки книг с новыми id
+    done = [(conn.execute("INSERT INTO books (title, author, status) VALUES (?, ?, ?)", book).lastrowid,)
+            + tuple(book) for book in books]
+    fuzzy.refresh(conn)
+    return BatchResult(done, [])
+
+
+def delete_books(conn, book_ids):
+    # Выданные книги не удаляются: открытая запись истории осталась бы без книги.
+    # Они попадают в failed вместе с несуществующими
+    placeholders = ", ".join("?" * len(book_ids))
+    found = [row[0] for row in conn.execute(
+        f"SELECT id FROM books WHERE id IN ({placeholders}) AND NOT EXISTS "
+        "(SELECT 1 FROM history WHERE history.book_id = books.id AND date_returned IS NULL)", book_ids)]
+    if found:
+        conn.execute(f"DELETE FROM books WHERE id IN ({', '.join('?' * len(found))})", found)
+    found = set(found)
+    return BatchResult([book_id for book_id in book_ids if book_id in found],
+                       [book_id for book_id in book_ids if book_id not in found])
+
+
+def history_query(search="", status_filter="Все", after=None, limit=100):
+    # Постраничная выборка по ключу (date_taken, id) вместо OFFSET:
+    # каждая следующая страница начинается с места, где закончилась предыдущая
+    query = f"SELECT {HISTORY_COLUMNS} FROM history"
+    conditions = []
+    params = []
+
+    match = db.fts_query(search)
+    if match:
+        conditions.append("id IN (SELECT rowid FROM history_fts WHERE history_fts MATCH ?)")
+        params.append(match)
+
+    if status_filter == "Не возвращена":
+        conditions.append("date_returned IS NULL")
+    elif status_filter == "Возвращена":
+        conditions.append("date_returned IS NOT NULL")
+
+    if after is not None:
+        conditions.append("(date_taken, id) < (?, ?)")
+        params.extend(after)
+
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+
+    query += " ORDER BY date_taken DESC, id DESC LIMIT ?"
+    params.append(limit)
+    return query, params
+
+
+class LibraryService:
+    def __init__(self, checkout=None):
+        self.checkout = checkout or CheckoutEngine()
+
+    def init_db(self):
+        db.init_db()
+
+    # Книги
+
+    def search_books(self, text="", fuzzy_mode=False):
+        with db.connection() as conn:
+            return search_books(conn, text, fuzzy_mode)
+
+    def add_book(self, title, author, status=STATUS_AVAILABLE):
+        with metrics.timed("add_book"), db.transaction() as conn:
+            book_id = conn.execute("INSERT INTO books (title, author, status) VALUES (?, ?, ?)",
+                                   (title, author, status)).lastrowid
+            fuzzy.refresh(conn)
+            return book_id
+
+    def delete_book(self, book_id):
+        # Возвращает True, если книга была удалена; выданную книгу сначала нужно вернуть
+        return bool(self.checkout.run(delete_books, [book_id]).done)
+
+    # Пакетные операции над выбранными книгами
+
+    def add_books(self, books, status=STATUS_AVAILABLE, progress=None, cancelled=None):
+        rows = [(title, author, status) for title, author in books]
+        with metrics.timed("add_books"):
+            return run_chunked(lambda chunk: self.checkout.run(insert_books, chunk), rows,
+                               progress=progress, cancelled=cancelled)
+
+    def delete_books(self, book_ids, progress=None, cancelled=None):
+        with metrics.timed("delete_books"):
+            return run_chunked(lambda chunk: self.checkout.run(delete_books, chunk), book_ids,
+                               progress=progress, cancelled=cancelled)
+
+    def set_status(self, username, book_ids, status, progress=None, cancelled=None):
+        # Смена статуса — это выдача или возврат с записью в историю.
+        # В done — (id, новый статус): возвращённая книга может сразу уйти следующему в очереди
+        if status == STATUS_BORROWED:
+            def operation(chunk):
+                done, failed = self.borrow_books(username, chunk)
+                return BatchResult([(book_id, STATUS_BORROWED) for book_id in done], failed)
+        else:
+            operation = self.return_books
+        return run_chunked(operation, book_ids, progress=progress, cancelled=cancelled)
+
+    def book_status(self, book_id):
+        row = db.query_one("SELECT status FROM books WHERE id = ?", (book_id,))
+        return row[0] if row else None
+
+    def borrow_book(self, username, book_id):
+        # False, если книгу уже выдали (в том числе с другого терминала)
+        return self.checkout.borrow(username, book_id)
+
+    def return_book(self, book_id):
+        # Статус после возврата или None; "Занята", если книгу сразу выдали по брони
+        return self.checkout.give_back(book_id)
+
+    def borrow_books(self, username, book_ids):
+        return self.checkout.borrow_many(username, book_ids)
+
+    def return_books(self, book_ids):
+        return self.checkout.return_many(book_ids)
+
+    # Очередь бронирования
+
+    def reserve(self, username, book_id):
+        # Номер в очереди или None, если книга не выдана или уже у этого читателя
+        with db.transaction() as conn:
+            return loans.reserve(conn, username, book_id)
+
+    def cancel_reservation(self, username, book_id):
+        with db.transaction() as conn:
+            return loans.cancel(conn, username, book_id)
+
+    def queue_position(self, username, book_id):
+        with db.connection() as conn:
+            return loans.queue_position(conn, username, book_id)
+
+    def reservations(self, book_id):
+        with db.connection() as conn:
+            return loans.queue(conn, book_id)
+
+    def overdue_loans(self, limit=100):
+        with db.connection() as conn:
+            return loans.overdue(conn, limit)
+
+    def overdue_count(self):
+        with db.connection() as conn:
+            return loans.overdue_count(conn)
+
+    def toggle_status(self, username, book_id, current_status):
+        # Возвращает новый статус и признак того, что он действительно изменился
+        if current_status == STATUS_BORROWED:
+            status = self.return_book(book_id)
+            return status or STATUS_AVAILABLE, status is not None
+        return STATUS_BORROWED, self.borrow_book(username, book_id)
+
+    # Пользователи
+
+    def authenticate(self, username, password, source=None):
+        # Возвращает роль пользователя или None; при частых ошибках — LoginThrottled.
+        # source — откуда пришёл вход, если вызывающий это знает (см. auth.LoginRateLimiter)
+        auth.limiter.check(username, source)
+        with metrics.timed("authenticate"):
+            # Пользователь, хеш и роль читаются всегда: удалённый пользователь, новый
+            # пароль или роль действуют сразу. Кэш лишь избавляет от повторного scrypt
+            row = db.query_one("SELECT id, password, role FROM users WHERE username = ?", (username,))
+            if row is None:
+                auth.verify_password(password, auth.dummy_hash())  # то же время, что и для настоящего имени
+                ok, rehash = False, False
+            elif auth.sessions.lookup(username, password, row[1]):
+                ok, rehash = True, False
+            else:
+                ok, rehash = auth.verify_password(password, row[1])
+        if not ok:
+            auth.limiter.failure(username, source)
+            return None
+        stored = row[1]
+        if rehash:
+            # Открытый пароль или устаревшие параметры хеша заменяются при входе
+            stored = auth.hash_password(password)
+            db.execute("UPDATE users SET password = ? WHERE id = ?", (stored, row[0]))
+        auth.limiter.success(username)
+        auth.sessions.remember(username, password, stored)
+        return row[2]
+
+    def login(self, username, password, source=None):
+        # Возвращает сессию с токеном или None
+        role = self.authenticate(username, password, source)
+        return auth.sessions.issue(username, role) if role is not None else None
+
+    def session(self, token):
+        # Сессия действует, пока пользователь есть в базе с той же ролью
+        session = auth.sessions.get(token)
+        if session is None:
+            return None
+        row = db.query_one("SELECT role FROM users WHERE username = ?", (session.username,))
+        if row is None or row[0] != session.role:
+            auth.sessions.forget(session.username)
+            return None
+        return session
+
+    def logout(self, token):
+        auth.sessions.revoke(token)
+
+    def register(self, username, password):
+        try:
+            db.execute("INSERT INTO users (username, password, role) VALUES (?, ?, 'guest')",
+                       (username, auth.hash_password(password)))
+        except sqlite3.IntegrityError:
+            return False  # Имя пользователя уже занято
+        auth.sessions.forget(username)  # сессии прежнего владельца этого имени
+        return True
+
+    # История
+
+    def history_page(self, search="", status_filter="Все", after=None, limit=100):
+        key = (search, status_filter, after, limit)
+        version = db.data_version()  # до запроса: результат не старше этой версии
+        records = history_cache.get(key, version)
+        if records is not None:
+            return records
+        query, params = history_query(search, status_filter, after, limit)
+        with metrics.timed("history_page"):
+            records = db.query(query, params)
+        history_cache.put(key, version, records)
+        return records
+
+    def delete_history_record(self, record_id):
+        db.execute("DELETE FROM history WHERE id = ?", (record_id,))
+
+    def history_count(self):
+        return db.row_count("history")
+
+    # Архив: старые закрытые выдачи в отдельной базе
+
+    def archive_history(self, age_days=archive.ARCHIVE_AGE_DAYS, compress=True, progress=None, cancelled=None):
+        with metrics.timed("archive_history"):
+            return archive.archive_history(age_days, compress=compress, progress=progress, cancelled=cancelled)
+
+    def search_archive(self, search="", limit=archive.SEARCH_LIMIT):
+        with metrics.timed("search_archive"):
+            return archive.search(search, limit)
+
+    def archived_count(self):
+        return archive.archived_count()
+
+    def change_seq(self):
+        # Последний номер журнала изменений
+        with db.connection() as conn:
+            return changelog.last_seq(conn)
+
+    # Отчёты
+
+    def report(self, limit=10, days=30):
+        with metrics.timed("report"), db.connection() as conn:
+            return analytics.report(conn, limit, days)
+
+    def rebuild_analytics(self, progress=None):
+        # Пересчёт агрегатов по всей истории и архиву, например после ручной правки базы
+        analytics.rebuild(db.transaction, progress=progress, archived=archive.archived_loans())
+
+
+# Асинхронный вариант: те же операции выполняются в потоках по умолчанию,
+# поэтому из asyncio можно запускать тысячи выдач одновременно
+class AsyncLibraryService:
+    def __init__(self, service=None):
+        self.service = service or LibraryService()
+
+    def __getattr__(self, name):
+        method = getattr(self.service, name)
+
+        import asyncio  # не замедляет запуск приложения, которому он не нужен
+
+        async def call(*args, **kwargs):
+            return await asyncio.to_thread(method, *args, **kwargs)
+
+        call.__name__ = name
+        return call
@@ -0,0 +1,77 @@
+from array import array
+
+STATUS_AVAILABLE = "Доступна"
+STATUS_BORROWED = "Занята"
+
+
+# Компактное хранилище книг: по одной колонке на поле,
+# id и статус лежат в массивах, а не в отдельных объектах на каждую ячейку
+class BookStore:
+    def __init__(self, rows=()):
+        self.ids = array("q")
+        self.titles = []
+        self.authors = []
+        self.borrowed = array("b")
+        self.positions = None  # id -> номер строки, строится по требованию
+        self.extend(rows)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def append(self, book_id, title, author, status):
+        if self.positions is not None:
+            self.positions[book_id] = len(self.ids)
+        self.ids.append(book_id)
+        self.titles.append(title)
+        self.authors.append(author)
+        self.borrowed.append(status == STATUS_BORROWED)
+
+    def find(self, book_id):
+        if self.positions is None:
+            self.positions = {book_id: row for row, book_id in enumerate(self.ids)}
+        return self.positions.get(book_id)
+
+    def removeRange(self, first, last):
+        del self.ids[first:last + 1]
+        del self.titles[first:last + 1]
+        del self.authors[first:last + 1]
+        del self.borrowed[first:last + 1]
+        self.positions = None
+
+    def removeRows(self, rows):
+        # Удаление многих строк за один проход вместо remove по одной
+        keep = [row for row in range(len(self)) if row not in rows]
+        self.ids = array("q", (self.ids[i] for i in keep))
+        self.titles = [self.titles[i] for i in keep]
+        self.authors = [self.authors[i] for i in keep]
+        self.borrowed = array("b", (self.borrowed[i] for i in keep))
+        self.positions = None
+
+    def setStatus(self, row, status):
+        self.borrowed[row] = status == STATUS_BORROWED
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(*row)
+
+    def status(self, row):
+        return STATUS_BORROWED if self.borrowed[row] else STATUS_AVAILABLE
+
+    def value(self, row, column):
+        if column == 0:
+            return self.titles[row]
+        if column == 1:
+            return self.authors[row]
+        return self.status(row)
+
+    def book(self, row):
+        return self.ids[row], self.titles[row], self.authors[row], self.status(row)
+
+    def sort(self, column, descending=False):
+        keys = (self.titles, self.authors, self.borrowed)[column]
+        order = sorted(range(len(self)), key=keys.__getitem__, reverse=descending)
+        self.ids = array("q", (self.ids[i] for i in order))
+        self.titles = [self.titles[i] for i in order]
+        self.authors = [self.authors[i] for i in order]
+        self.borrowed = array("b", (self.borrowed[i] for i in order))
+        self.positions = None
@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import auth
+import db
+from service import LibraryService, history_cache
+
+
+@pytest.fixture
+def library(tmp_path):
+    # Пустая база во временном каталоге вместо library.db
+    db.configure(str(tmp_path / "library.db"))
+    db.init_db()
+    history_cache.clear()
+    auth.sessions = auth.SessionCache()
+    auth.limiter = auth.LoginRateLimiter()
+    yield LibraryService()
+    db.configure(db.DB_PATH)
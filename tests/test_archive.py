@@ -0,0 +1,50 @@
+from contextlib import contextmanager
+
+import pytest
+
+import analytics
+import archive
+import db
+
+
+def old_loan(library):
+    book_id = library.add_book("Бесы", "Достоевский")
+    library.borrow_book("anna", book_id)
+    library.return_book(book_id)
+    db.execute("UPDATE history SET date_taken = datetime('now', '-800 days'), "
+               "date_returned = datetime('now', '-790 days')")
+    return book_id
+
+
+def top_loans():
+    with db.connection() as conn:
+        return [row[2] for row in analytics.top_books(conn)]
+
+
+def test_rebuild_in_progress_copies_nothing(library):
+    old_loan(library)
+    db.execute("INSERT INTO stats_rebuild (high_water, done) VALUES (1, 0)")
+    assert library.archive_history() == 0
+    assert library.archived_count() == 0 and library.history_count() == 1
+
+
+def test_interrupted_archive_is_not_copied_twice(library, monkeypatch):
+    old_loan(library)
+
+    @contextmanager
+    def crash(conn):
+        raise RuntimeError("сбой между коммитами")
+        yield conn
+
+    # Пачка зафиксирована в архиве, но удаление из history откатилось
+    monkeypatch.setattr(analytics, "kept", crash)
+    with pytest.raises(RuntimeError):
+        library.archive_history()
+    monkeypatch.undo()
+    assert library.archived_count() == 1 and library.history_count() == 1
+
+    assert library.archive_history() == 1
+    assert library.archived_count() == 1 and library.history_count() == 0
+    assert len(library.search_archive()) == 1
+    library.rebuild_analytics()
+    assert top_loans() == [1]
@@ -0,0 +1,38 @@
+import pytest
+
+import auth
+import db
+
+
+def test_cached_login_sees_password_role_and_user_changes(library):
+    library.register("anna", "secret")
+    assert library.authenticate("anna", "secret") == "guest"
+
+    db.execute("UPDATE users SET role = 'admin' WHERE username = 'anna'")
+    assert library.authenticate("anna", "secret") == "admin"
+
+    db.execute("UPDATE users SET password = ? WHERE username = 'anna'", (auth.hash_password("changed"),))
+    assert library.authenticate("anna", "secret") is None
+    assert library.authenticate("anna", "changed") == "admin"
+
+    db.execute("DELETE FROM users WHERE username = 'anna'")
+    assert library.authenticate("anna", "changed") is None
+
+
+def test_session_ends_when_role_changes(library):
+    library.register("anna", "secret")
+    session = library.login("anna", "secret")
+    assert library.session(session.token) == session
+    db.execute("UPDATE users SET role = 'admin' WHERE username = 'anna'")
+    assert library.session(session.token) is None
+
+
+def test_failures_throttle_username_and_own_source_only(library):
+    auth.limiter = auth.LoginRateLimiter(limit=3, source_limit=3)
+    for name in ("a", "b", "c"):
+        assert library.authenticate(name, "guess", source="10.0.0.1") is None
+    with pytest.raises(auth.LoginThrottled):
+        library.authenticate("d", "guess", source="10.0.0.1")
+    # Другой источник и вход без источника не заблокированы
+    assert library.authenticate("d", "guess", source="10.0.0.2") is None
+    assert library.authenticate("e", "guess") is None
@@ -0,0 +1,17 @@
+import sqlite3
+
+from branches import FederatedCatalog
+
+
+def test_totals_cover_more_branches_than_attach_limit(tmp_path):
+    count = sqlite3.connect(":memory:").getlimit(sqlite3.SQLITE_LIMIT_ATTACHED) + 2
+    catalog = FederatedCatalog([(f"branch{i}", str(tmp_path / f"branch{i}.db")) for i in range(count)])
+    try:
+        catalog.init_db()
+        for number, branch in enumerate(catalog.branches):
+            with branch.pool.transaction() as conn:
+                conn.executemany("INSERT INTO books (title, author, status) VALUES (?, ?, 'Доступна')",
+                                 [(f"Книга {i}", "Автор") for i in range(number)])
+        assert catalog.totals() == [(f"branch{i}", i, 0) for i in range(count)]
+    finally:
+        catalog.close()
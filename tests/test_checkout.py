@@ -0,0 +1,80 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import db
+from checkout import CheckoutEngine
+
+THREADS = 8
+
+
+def race(operation, args):
+    # Все потоки стартуют одновременно, чтобы транзакции действительно пересекались
+    barrier = threading.Barrier(len(args))
+
+    def run(arg):
+        barrier.wait()
+        return operation(*arg)
+
+    with ThreadPoolExecutor(len(args)) as pool:
+        return list(pool.map(run, args))
+
+
+def open_loans():
+    return db.query("SELECT book_id, username FROM history WHERE date_returned IS NULL ORDER BY book_id")
+
+
+def test_one_copy_is_borrowed_once(library):
+    book_id = library.add_book("Бесы", "Достоевский")
+    results = race(library.borrow_book, [(f"reader{i}", book_id) for i in range(THREADS)])
+    assert results.count(True) == 1
+    winner = f"reader{results.index(True)}"
+    assert open_loans() == [(book_id, winner)]
+    assert library.book_status(book_id) == "Занята"
+
+
+def test_one_copy_is_returned_once(library):
+    book_id = library.add_book("Бесы", "Достоевский")
+    library.borrow_book("anna", book_id)
+    results = race(library.return_book, [(book_id,)] * THREADS)
+    assert results.count("Доступна") == 1 and results.count(None) == THREADS - 1
+    assert open_loans() == []
+    assert db.query_one("SELECT COUNT(*) FROM history WHERE date_returned IS NOT NULL")[0] == 1
+
+
+def test_overlapping_batches_borrow_each_book_once(library):
+    book_ids = [row[0] for row in library.add_books([(f"Книга {i}", "Автор") for i in range(40)]).done]
+    # Каждый поток берёт все книги, начиная со своей: пачки пересекаются
+    batches = [(f"reader{i}", book_ids[i * 5:] + book_ids[:i * 5]) for i in range(THREADS)]
+    results = race(library.borrow_books, batches)
+    done = [book_id for result in results for book_id in result.done]
+    assert sorted(done) == book_ids
+    assert [book_id for book_id, _ in open_loans()] == book_ids
+    assert library.report()["open"] == len(book_ids)
+
+
+def test_borrow_and_return_under_load(library):
+    book_id = library.add_book("Бесы", "Достоевский")
+    engine = CheckoutEngine(attempts=20)
+
+    def toggle(reader):
+        for _ in range(10):
+            engine.borrow(reader, book_id)
+            engine.give_back(book_id)
+
+    race(toggle, [(f"reader{i}",) for i in range(THREADS)])
+    borrowed = db.query_one("SELECT status FROM books WHERE id = ?", (book_id,))[0] == "Занята"
+    assert len(open_loans()) == int(borrowed)
+    taken, returned = db.query_one("SELECT COUNT(*), COUNT(date_returned) FROM history")
+    assert taken - returned == int(borrowed)
+
+
+def test_borrowed_books_are_not_deleted(library):
+    borrowed = library.add_book("Бесы", "Достоевский")
+    free = library.add_book("Идиот", "Достоевский")
+    library.borrow_book("anna", borrowed)
+    assert not library.delete_book(borrowed)
+    result = library.delete_books([borrowed, free, free + 1])
+    assert result.done == [free] and result.failed == [borrowed, free + 1]
+    assert open_loans() == [(borrowed, "anna")]
+    library.return_book(borrowed)
+    assert library.delete_book(borrowed)
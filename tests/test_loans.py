@@ -0,0 +1,57 @@
+import sqlite3
+
+import db
+import transfer
+
+
+def open_loans(book_id):
+    return db.query("SELECT username FROM history WHERE book_id = ? AND date_returned IS NULL", (book_id,))
+
+
+def test_return_hands_book_to_first_in_queue(library):
+    book_id = library.add_book("Бесы", "Достоевский")
+    assert library.borrow_book("anna", book_id)
+    assert library.reserve("boris", book_id) == 1
+    assert library.reserve("vera", book_id) == 2
+    assert library.reserve("anna", book_id) is None  # книга и так у неё
+
+    assert library.toggle_status("anna", book_id, "Занята") == ("Занята", True)
+    assert library.book_status(book_id) == "Занята"
+    assert open_loans(book_id) == [("boris",)]
+    assert library.queue_position("vera", book_id) == 1
+    assert library.queue_position("boris", book_id) is None
+
+
+def test_reserve_available_book_is_refused(library):
+    book_id = library.add_book("Идиот", "Достоевский")
+    assert library.reserve("boris", book_id) is None
+    assert library.reservations(book_id) == []
+
+
+def test_cancelled_reservation_is_skipped(library):
+    book_id = library.add_book("Бесы", "Достоевский")
+    library.borrow_book("anna", book_id)
+    library.reserve("boris", book_id)
+    assert library.cancel_reservation("boris", book_id)
+    assert library.return_book(book_id) == "Доступна"
+    assert library.book_status(book_id) == "Доступна"
+
+
+def test_bulk_return_reports_handed_off_books(library):
+    reserved = library.add_book("Бесы", "Достоевский")
+    free = library.add_book("Идиот", "Достоевский")
+    library.borrow_books("anna", [reserved, free])
+    library.reserve("boris", reserved)
+    result = library.set_status("admin", [reserved, free], "Доступна")
+    assert sorted(result.done) == [(reserved, "Занята"), (free, "Доступна")]
+
+
+def test_due_date_defaults_for_loans_written_elsewhere(library):
+    conn = sqlite3.connect(db.pool.path)
+    conn.execute("INSERT INTO history (username, book_title, date_taken) VALUES ('anna', 'Бесы', '2020-01-01 10:00:00')")
+    conn.commit()
+    conn.close()
+    transfer.import_rows("history", [("boris", "Идиот", "2020-02-01 10:00:00", None, None)])
+    assert db.query("SELECT username, due_date FROM history ORDER BY id") == [
+        ("anna", "2020-01-15 10:00:00"), ("boris", "2020-02-15 10:00:00")]
+    assert library.overdue_count() == 2
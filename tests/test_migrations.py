@@ -0,0 +1,81 @@
+import sqlite3
+
+import db
+import migrations
+from service import LibraryService
+
+
+def baseline_database(path):
+    # Схема и данные до миграций: история ссылается на книги по названию
+    conn = sqlite3.connect(path)
+    for table in db.TABLES:
+        conn.execute(table)
+    conn.executemany("INSERT INTO books (title, author, status) VALUES (?, ?, ?)", [
+        ("Бесы", "Фёдор Достоевский", "Доступна"),
+        ("Бесы", "Фёдор Достоевский", "Занята"),
+        ("Война и мир", "Лев Толстой", "Доступна"),
+    ])
+    conn.execute("INSERT INTO users (username, password, role) VALUES ('anna', 'secret', 'guest')")
+    conn.executemany("INSERT INTO history (username, book_title, date_taken, date_returned) VALUES (?, ?, ?, ?)", [
+        ("anna", "Война и мир", "2020-01-01 10:00:00", "2020-01-10 10:00:00"),
+        ("anna", "Бесы", "2020-02-01 10:00:00", None),
+        ("boris", "Утраченная книга", "2020-03-01 10:00:00", "2020-03-02 10:00:00"),
+    ])
+    conn.commit()
+    conn.close()
+
+
+def test_migrate_baseline_schema(tmp_path):
+    path = str(tmp_path / "library.db")
+    baseline_database(path)
+    db.configure(path)
+    try:
+        assert db.init_db()
+        assert db.query("PRAGMA user_version") == [(len(migrations.MIGRATIONS),)]
+        assert not db.init_db()  # повторный запуск ничего не меняет
+
+        # Открытая выдача связана с занятым экземпляром, закрытые — с первым по названию
+        assert db.query("SELECT book_title, book_id, user_id FROM history ORDER BY id") == [
+            ("Война и мир", 3, 1), ("Бесы", 2, 1), ("Утраченная книга", None, None)]
+        assert db.query("SELECT due_date FROM history WHERE date_returned IS NULL") == [("2020-02-15 10:00:00",)]
+        assert db.row_count("books") == 3 and db.row_count("history") == 3
+
+        service = LibraryService()
+        report = service.report()
+        assert report["open"] == 1
+        assert sorted(report["top_books"]) == [(2, "Бесы", 1, 1), (3, "Война и мир", 1, 0)]
+        assert report["overdue"] == 1
+
+        fuzzy = service.search_books("Тольстой", fuzzy_mode=True)
+        assert [fuzzy.book(row)[1] for row in range(len(fuzzy))] == ["Война и мир"]
+        found = service.search_books("дост")
+        assert len(found) == 2
+
+        # Запись в базу без функций приложения, как из sqlite3 или старой версии
+        other = sqlite3.connect(path)
+        other.execute("INSERT INTO books (title, author) VALUES ('Идиот', 'Фёдор Достоевский')")
+        other.commit()
+        other.close()
+        fuzzy = service.search_books("Идеот", fuzzy_mode=True)
+        assert [fuzzy.book(row)[1] for row in range(len(fuzzy))] == ["Идиот"]
+
+        # Открытый пароль заменяется хешем при первом входе
+        assert service.authenticate("anna", "secret") == "guest"
+        assert db.query_one("SELECT password FROM users WHERE username = 'anna'")[0] != "secret"
+    finally:
+        db.configure(db.DB_PATH)
+
+
+def test_migrations_resume_from_recorded_version(tmp_path):
+    path = str(tmp_path / "library.db")
+    baseline_database(path)
+    db.configure(path)
+    try:
+        with db.transaction() as conn:
+            migrations.MIGRATIONS[0](conn)
+            conn.execute("PRAGMA user_version = 1")
+        db.init_db()
+        assert db.query("PRAGMA user_version") == [(len(migrations.MIGRATIONS),)]
+        assert db.query_one("SELECT COUNT(*) FROM history WHERE book_id IS NOT NULL")[0] == 2
+    finally:
+        db.configure(db.DB_PATH)
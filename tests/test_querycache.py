@@ -0,0 +1,47 @@
+import sqlite3
+
+import db
+from querycache import QueryCache
+from service import history_cache
+
+
+def test_lru_eviction():
+    cache = QueryCache(max_entries=2)
+    assert cache.get("a", 1) is None
+    cache.put("a", 1, [(1,)])
+    cache.put("b", 1, [(2,)])
+    assert cache.get("a", 1) == [(1,)]
+    cache.put("c", 1, [(3,)])
+    assert cache.get("b", 1) is None
+    assert cache.get("a", 1) == [(1,)]
+
+
+def test_result_from_older_version_is_not_stored():
+    cache = QueryCache()
+    cache.get("a", 2)
+    cache.put("a", 1, [(1,)])
+    assert cache.get("a", 2) is None
+
+
+def test_history_page_cached_until_own_write(library):
+    library.add_book("Идиот", "Достоевский")
+    book_id = library.add_book("Бесы", "Достоевский")
+    assert library.borrow_book("reader", book_id)
+    first = library.history_page()
+    hits = history_cache.hits
+    assert library.history_page() == first
+    assert history_cache.hits == hits + 1
+
+    library.return_book(book_id)
+    records = library.history_page()
+    assert history_cache.hits == hits + 1
+    assert records[0][4] != "Не возвращена"
+
+
+def test_history_page_sees_other_connection_write(library):
+    assert library.history_page() == []
+    conn = sqlite3.connect(db.pool.path)
+    conn.execute("INSERT INTO history (username, book_title, date_taken) VALUES ('reader', 'Бесы', datetime('now'))")
+    conn.commit()
+    conn.close()
+    assert [record[1] for record in library.history_page()] == ["reader"]
@@ -0,0 +1,84 @@
+import pytest
+
+import db
+import transfer
+from service import LibraryService
+
+
+def test_history_round_trip_keeps_loans_closable(library, tmp_path):
+    library.register("anna", "secret")
+    book_id = library.add_book("Бесы", "Достоевский")
+    library.add_book("Бесы", "Достоевский")
+    library.borrow_book("anna", book_id)
+    for table in ("books", "users", "history"):
+        transfer.export_table(table, str(tmp_path / f"{table}.csv"))
+
+    db.configure(str(tmp_path / "copy.db"))
+    db.init_db()
+    for table in ("books", "users", "history"):
+        transfer.import_file(table, str(tmp_path / f"{table}.csv"))
+
+    # Открытая выдача связана с занятым экземпляром и с читателем
+    assert db.query("SELECT book_id, user_id, date_returned FROM history") == [(book_id, 1, None)]
+    service = LibraryService()
+    assert service.report()["open"] == 1
+    assert service.return_book(book_id)
+    assert db.query("SELECT COUNT(*) FROM history WHERE date_returned IS NULL") == [(0,)]
+    assert service.report()["open"] == 0
+
+
+def tables():
+    return {table: list(transfer.iter_table(table)) for table in transfer.TABLES}
+
+
+@pytest.mark.parametrize("fmt", transfer.FORMATS)
+def test_round_trip_keeps_every_column(library, tmp_path, fmt):
+    library.register("anna", "secret")
+    returned = library.add_book("Бесы", "Достоевский")
+    borrowed = library.add_book("Идиот", "Достоевский")
+    library.add_book("Нос", "Гоголь")
+    library.borrow_books("anna", [returned, borrowed])
+    library.return_book(returned)
+    original = tables()
+    for table in transfer.TABLES:
+        assert transfer.export_table(table, str(tmp_path / f"{table}.{fmt}")) == len(original[table])
+
+    db.configure(str(tmp_path / "copy.db"))
+    db.init_db()
+    for table in ("books", "users", "history"):
+        transfer.import_file(table, str(tmp_path / f"{table}.{fmt}"))
+    assert tables() == original
+
+
+def test_missing_columns_take_schema_defaults(library, tmp_path):
+    (tmp_path / "books.csv").write_text("title,author\nБесы,Достоевский\n", encoding="utf-8")
+    (tmp_path / "users.jsonl").write_text('{"username": "anna", "password": "x"}\n', encoding="utf-8")
+    transfer.import_file("books", str(tmp_path / "books.csv"))
+    transfer.import_file("users", str(tmp_path / "users.jsonl"))
+    assert db.query("SELECT title, status FROM books") == [("Бесы", "Доступна")]
+    assert db.query("SELECT username, role FROM users") == [("anna", "guest")]
+
+
+@pytest.mark.parametrize("name, text", [
+    ("books.csv", "title,author,status\nБесы,Достоевский,Утеряна\n"),
+    ("books.csv", "title,author,status\nБесы,Достоевский,\n"),
+    ("books.jsonl", '{"title": "Бесы", "author": "Достоевский", "status": null}\n'),
+])
+def test_invalid_choice_is_rejected(library, tmp_path, name, text):
+    (tmp_path / name).write_text(text, encoding="utf-8")
+    with pytest.raises(ValueError, match="status"):
+        transfer.import_file("books", str(tmp_path / name))
+    assert db.row_count("books") == 0
+
+
+def test_cancel_between_chunks(library, tmp_path):
+    rows = [(f"Книга {i}", "Автор", "Доступна") for i in range(5)]
+    done = []
+    with pytest.raises(transfer.TransferCancelled) as cancelled:
+        transfer.import_rows("books", rows, chunk_size=2, progress=done.append, cancelled=lambda: bool(done))
+    # Пачка, уже закоммиченная до отмены, остаётся в базе
+    assert cancelled.value.count == 2 and db.row_count("books") == 2
+
+    with pytest.raises(transfer.TransferCancelled) as cancelled:
+        transfer.export_table("books", str(tmp_path / "books.csv"), chunk_size=1, cancelled=lambda: True)
+    assert cancelled.value.count == 1
@@ -0,0 +1,151 @@
+import csv
+import json
+import os
+
+import db
+import fuzzy
+
+# Колонки, которые переносятся при импорте и экспорте
+TABLES = {
+    "books": ("title", "author", "status"),
+    "history": ("username", "book_title", "date_taken", "date_returned", "due_date"),
+    "users": ("username", "password", "role"),
+}
+# В CSV пустая строка означает NULL только для этих колонок
+NULLABLE = ("date_returned", "due_date")
+# Значения для колонок, которых нет в файле: явный NULL обошёл бы DEFAULT схемы,
+# а CHECK его пропускает, и такую книгу нельзя выдать, а пользователь не войдёт
+DEFAULTS = {"status": "Доступна", "role": "guest"}
+CHOICES = {"status": ("Доступна", "Занята"), "role": ("admin", "guest")}
+FORMATS = ("csv", "jsonl")
+CHUNK_SIZE = 5000  # строк на одну транзакцию при импорте и на одну выборку при экспорте
+
+
+class TransferCancelled(Exception):
+    def __init__(self, count):
+        super().__init__(f"Операция отменена после {count} строк")
+        self.count = count
+
+
+def detect_format(path, fmt=None):
+    fmt = fmt or os.path.splitext(path)[1].lstrip(".").lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"Неизвестный формат: {fmt}")
+    return fmt
+
+
+def chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# Чтение: генераторы, файл целиком в память не загружается
+
+def field(record, column, number):
+    if column not in record:
+        return DEFAULTS.get(column)
+    value = record[column]
+    if column in CHOICES and value not in CHOICES[column]:
+        raise ValueError(f"Строка {number}: недопустимое значение {column}: {value!r}")
+    return value
+
+
+def read_csv(file, columns):
+    for number, record in enumerate(csv.DictReader(file), start=2):
+        yield tuple(None if column in NULLABLE and not record.get(column) else field(record, column, number)
+                    for column in columns)
+
+
+def read_jsonl(file, columns):
+    for number, line in enumerate(file, start=1):
+        if line.strip():
+            record = json.loads(line)
+            yield tuple(field(record, column, number) for column in columns)
+
+
+def write_csv(file, columns, rows):
+    writer = csv.writer(file)
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow(row)
+        yield
+
+
+def write_jsonl(file, columns, rows):
+    for row in rows:
+        file.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n")
+        yield
+
+
+def read_pasted(text):
+    # Книги, вставленные из таблицы или списка: "Название<TAB>Автор" или "Название;Автор"
+    books = []
+    for number, line in enumerate(text.splitlines(), start=1):
+        if not line.strip():
+            continue
+        title, _, author = line.partition("\t" if "\t" in line else ";")
+        if not title.strip() or not author.strip():
+            raise ValueError(f"Строка {number}: нужны название и автор через табуляцию или ';'")
+        books.append((title.strip(), author.strip()))
+    return books
+
+
+READERS = {"csv": read_csv, "jsonl": read_jsonl}
+WRITERS = {"csv": write_csv, "jsonl": write_jsonl}
+
+
+def import_rows(table, rows, chunk_size=CHUNK_SIZE, progress=None, cancelled=None):
+    columns = TABLES[table]
+    query = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"
+    count = 0
+    for chunk in chunks(rows, chunk_size):
+        if cancelled and cancelled():
+            raise TransferCancelled(count)
+        # Каждая пачка — одна транзакция и один executemany
+        with db.transaction() as conn:
+            conn.executemany(query, chunk)
+            if table == "books":
+                fuzzy.refresh(conn)
+        count += len(chunk)
+        if progress:
+            progress(count)
+    return count
+
+
+def import_file(table, path, fmt=None, chunk_size=CHUNK_SIZE, progress=None, cancelled=None):
+    reader = READERS[detect_format(path, fmt)]
+    with open(path, newline="", encoding="utf-8") as file:
+        return import_rows(table, reader(file, TABLES[table]), chunk_size, progress, cancelled)
+
+
+def iter_table(table, chunk_size=CHUNK_SIZE):
+    # Строки читаются курсором по мере записи, а не fetchall()
+    with db.connection() as conn:
+        cursor = conn.execute(f"SELECT {', '.join(TABLES[table])} FROM {table} ORDER BY id")
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield from rows
+
+
+def export_table(table, path, fmt=None, chunk_size=CHUNK_SIZE, progress=None, cancelled=None):
+    writer = WRITERS[detect_format(path, fmt)]
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        for _ in writer(file, TABLES[table], iter_table(table, chunk_size)):
+            count += 1
+            if count % chunk_size == 0:
+                if cancelled and cancelled():
+                    raise TransferCancelled(count)
+                if progress:
+                    progress(count)
+    if progress:
+        progress(count)
+    return count
@@ -0,0 +1,53 @@
+import csv
+import sqlite3
+
+from PyQt5.QtCore import Qt, QThread, pyqtSignal
+from PyQt5.QtWidgets import QProgressDialog, QMessageBox
+
+import transfer
+
+TRANSFER_FILTER = "CSV (*.csv);;JSON Lines (*.jsonl)"
+
+# Поток для импорта и экспорта
+class TransferWorker(QThread):
+    progressed = pyqtSignal(int)
+
+    def __init__(self, operation, *args):
+        super().__init__()
+        self.operation = operation
+        self.args = args
+        self.count = 0
+        self.cancel_requested = False
+        self.error = None
+
+    def cancel(self):
+        self.cancel_requested = True
+
+    def run(self):
+        try:
+            self.count = self.operation(*self.args, progress=self.progressed.emit,
+                                        cancelled=lambda: self.cancel_requested)
+        except transfer.TransferCancelled as e:
+            self.count = e.count
+        except (OSError, ValueError, csv.Error, sqlite3.Error) as e:
+            self.error = str(e)
+
+def run_transfer(parent, title, operation, *args):
+    worker = TransferWorker(operation, *args)
+    dialog = QProgressDialog(title, "Отмена", 0, 0, parent)
+    dialog.setWindowModality(Qt.WindowModal)
+    worker.progressed.connect(lambda count: dialog.setLabelText(f"{title}: {count} строк"))
+    worker.finished.connect(dialog.accept)
+    dialog.canceled.connect(worker.cancel)
+    worker.start()
+    dialog.exec_()
+    worker.wait()
+    return worker
+
+def report_transfer(parent, worker, done_message):
+    if worker.error:
+        QMessageBox.critical(parent, "Ошибка", worker.error)
+    elif worker.cancel_requested:
+        QMessageBox.warning(parent, "Отменено", f"Операция прервана, обработано строк: {worker.count}")
+    else:
+        QMessageBox.information(parent, "Успех", f"{done_message} Строк: {worker.count}")